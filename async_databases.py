@@ -0,0 +1,267 @@
+"""awaitable database layer for Daughter of Anton, keeps SQLite work off the discord event loop"""
+
+import asyncio
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+import constants
+from conversation_cache import ConversationCache
+from classes import (
+    Conversation,
+    Message,
+    UserProfile,
+    UserMessageHistoryEntry,
+    UserModerationHistoryEntry,
+    UserHistoryBundle,
+    UserStats,
+    UserSummary,
+)
+from databases import ConversationDatabaseManager, UsersDatabaseManager
+from objlog.LogMessages import Info, Debug
+
+T = TypeVar("T")
+
+
+class DatabaseWorkerPool:
+    """Owns the SQLite connections: one writer thread plus a pool of read-only connections.
+
+    All writes are funneled through a single thread (SQLite only allows one writer anyway), while reads
+    run on their own connections in parallel thanks to WAL mode.
+    """
+
+    def __init__(
+            self,
+            db_path: str = constants.DATABASE_FILE,
+            users_db_path: str = constants.USERS_DATABASE_FILE,
+            read_connections: int = constants.DATABASE_READ_CONNECTIONS,
+            unified: bool = constants.UNIFIED_STORAGE,
+    ) -> None:
+        def open_manager(migrate: bool) -> ConversationDatabaseManager:
+            if unified:
+                return ConversationDatabaseManager.open_unified(db_path, users_db_path, migrate=migrate)
+            return ConversationDatabaseManager(
+                db_path, users_manager=UsersDatabaseManager(users_db_path), migrate=migrate
+            )
+
+        # the writer runs the one-time migrations, the readers open an already migrated database
+        self.writer = open_manager(migrate=True)
+        self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="doa-db-writer")
+
+        self._readers: queue.SimpleQueue[ConversationDatabaseManager] = queue.SimpleQueue()
+        self._reader_managers: list[ConversationDatabaseManager] = []
+        for _ in range(read_connections):
+            reader = open_manager(migrate=False)
+            self._reader_managers.append(reader)
+            self._readers.put(reader)
+        # one thread per connection, so a worker never waits on the queue
+        self._reader_executor = ThreadPoolExecutor(
+            max_workers=read_connections, thread_name_prefix="doa-db-reader"
+        )
+        constants.MAIN_LOG.log(
+            Info(f"Database worker pool ready (1 writer, {read_connections} readers).")
+        )
+
+    async def write(self, operation: Callable[[ConversationDatabaseManager], T]) -> T:
+        """Run operation(manager) on the writer thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer_executor, operation, self.writer)
+
+    async def read(self, operation: Callable[[ConversationDatabaseManager], T]) -> T:
+        """Run operation(manager) on a pooled read connection."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_executor, self._run_read, operation)
+
+    def _run_read(self, operation: Callable[[ConversationDatabaseManager], T]) -> T:
+        reader = self._readers.get()
+        try:
+            # one read transaction per operation, so multi-query loads see a single snapshot
+            reader.connection.execute("BEGIN")
+            if not reader.unified:
+                reader.users_manager.connection.execute("BEGIN")
+            return operation(reader)
+        finally:
+            reader.connection.rollback()
+            if not reader.unified:
+                reader.users_manager.connection.rollback()
+            self._readers.put(reader)
+
+    def close(self) -> None:
+        """Finish queued work and close every connection."""
+        self._writer_executor.shutdown(wait=True)
+        self._reader_executor.shutdown(wait=True)
+        for manager in [self.writer, *self._reader_managers]:
+            manager.close()
+            manager.users_manager.close()
+
+
+class AsyncUsersDatabaseManager:
+    """Awaitable version of UsersDatabaseManager.
+
+    Name/id lookups are answered straight from the shared UserDirectory, without touching SQLite.
+    """
+
+    def __init__(self, pool: DatabaseWorkerPool) -> None:
+        self.pool = pool
+        # shared with every UsersDatabaseManager in the pool, lookups never need a thread hop
+        self.directory = pool.writer.users_manager.directory
+
+    async def resolve_user_names(self, user_ids: set[int]) -> dict[int, str]:
+        """{id: name} for every known id."""
+        return self.directory.names_for(user_ids)
+
+    async def resolve_user_ids(self, user_names: set[str]) -> dict[str, int]:
+        """{name: id} for every known name."""
+        return self.directory.ids_for(user_names)
+
+    async def upsert_user(
+            self,
+            user_id: int,
+            user_name: str,
+            nick: str | None = None,
+            notes: str | None = None,
+            last_message_uuid: str | None = None,
+            last_seen_at: int | None = None,
+    ) -> None:
+        await self.pool.write(
+            lambda manager: manager.users_manager.upsert_user(
+                user_id=user_id,
+                user_name=user_name,
+                nick=nick,
+                notes=notes,
+                last_message_uuid=last_message_uuid,
+                last_seen_at=last_seen_at,
+            )
+        )
+
+    async def upsert_users(self, users: list[tuple[int, str, str | None, int | None]]) -> int:
+        return await self.pool.write(lambda manager: manager.users_manager.upsert_users(users))
+
+    async def get_user_by_id(self, user_id: int) -> str | None:
+        return self.directory.names_for((user_id,)).get(user_id)
+
+    async def get_user_by_name(self, user_name: str) -> int | None:
+        return self.directory.ids_for((user_name,)).get(user_name)
+
+    async def cache_user(self, user_id: int, user_name: str) -> None:
+        await self.pool.write(lambda manager: manager.users_manager.cache_user(user_id, user_name))
+
+    async def set_user_profile_notes(
+            self,
+            user_id: int,
+            notes: str,
+            notes_message_count: int | None = None,
+            last_message_uuid: str | None = None,
+    ) -> None:
+        await self.pool.write(
+            lambda manager: manager.users_manager.set_user_profile_notes(
+                user_id, notes, notes_message_count, last_message_uuid
+            )
+        )
+
+    async def get_user_profile(self, user_id: int) -> UserProfile | None:
+        return await self.pool.read(lambda manager: manager.users_manager.get_user_profile(user_id))
+
+
+class AsyncConversationDatabaseManager:
+    """Awaitable version of ConversationDatabaseManager.
+
+    If a ConversationCache is given, loads are served from it when possible and saves write through it.
+    """
+
+    def __init__(self, pool: DatabaseWorkerPool, cache: ConversationCache | None = None) -> None:
+        self.pool = pool
+        self.cache = cache
+
+    async def save_conversation(
+            self, channel_id: int, conversation: Conversation, compact: bool = False
+    ) -> None:
+        try:
+            await self.pool.write(
+                lambda manager: manager.save_conversation(channel_id, conversation, compact=compact)
+            )
+        except Exception:
+            self.invalidate_cached_conversation(channel_id)
+            raise
+        if self.cache:
+            self.cache.store_saved(channel_id, conversation)
+
+    async def compact_conversation(self, channel_id: int) -> None:
+        self.invalidate_cached_conversation(channel_id)
+        await self.pool.write(lambda manager: manager.compact_conversation(channel_id))
+        # and again, a load that read the old rows while this ran may have cached them
+        self.invalidate_cached_conversation(channel_id)
+
+    async def delete_conversation(self, channel_id: int) -> None:
+        self.invalidate_cached_conversation(channel_id)
+        await self.pool.write(lambda manager: manager.delete_conversation(channel_id))
+        # and again, a load that read the old rows while this ran may have cached them
+        self.invalidate_cached_conversation(channel_id)
+
+    async def load_conversation(self, channel_id: int) -> Conversation:
+        generation = None
+        if self.cache:
+            cached = self.cache.get(channel_id)
+            if cached is not None:
+                constants.MAIN_LOG.log(
+                    Debug(
+                        f"Conversation cache hit for channel {channel_id} "
+                        f"(hit rate {self.cache.stats()['hit_rate']:.0%})"
+                    )
+                )
+                return cached
+            # a summary save or delete finishing while we read would make this copy stale
+            generation = self.cache.generation(channel_id)
+        conversation = await self.pool.read(lambda manager: manager.load_conversation(channel_id))
+        if self.cache:
+            self.cache.put(channel_id, conversation, generation)
+        return conversation
+
+    def invalidate_cached_conversation(self, channel_id: int) -> None:
+        if self.cache:
+            self.cache.invalidate(channel_id)
+
+    async def count_unsummarized_messages(self, channel_id: int) -> int:
+        return await self.pool.read(lambda manager: manager.count_unsummarized_messages(channel_id))
+
+    async def load_oldest_unsummarized_messages(
+            self, channel_id: int, limit: int
+    ) -> tuple[str | None, list[Message]]:
+        return await self.pool.read(
+            lambda manager: manager.load_oldest_unsummarized_messages(channel_id, limit)
+        )
+
+    async def save_conversation_summary(self, channel_id: int, summary: str, summarized_until: int) -> None:
+        await self.pool.write(
+            lambda manager: manager.save_conversation_summary(channel_id, summary, summarized_until)
+        )
+        # the cached copy still has the folded messages and the old summary
+        self.invalidate_cached_conversation(channel_id)
+
+    async def load_conversations(self) -> dict[int, Conversation]:
+        return await self.pool.read(lambda manager: manager.load_conversations())
+
+    async def get_message_from_uuid(self, uuid: str) -> Message | None:
+        return await self.pool.read(lambda manager: manager.get_message_from_uuid(uuid))
+
+    async def get_all_message_history_for_user(self, user_id: int) -> list[UserMessageHistoryEntry]:
+        return await self.pool.read(lambda manager: manager.get_all_message_history_for_user(user_id))
+
+    async def get_all_moderation_history_for_user(
+            self, user_id: int
+    ) -> list[UserModerationHistoryEntry]:
+        return await self.pool.read(lambda manager: manager.get_all_moderation_history_for_user(user_id))
+
+    async def get_user_history(self, user_id: int) -> UserHistoryBundle:
+        return await self.pool.read(lambda manager: manager.get_user_history(user_id))
+
+    async def get_user_stats(self, user_id: int) -> UserStats:
+        return await self.pool.read(lambda manager: manager.get_user_stats(user_id))
+
+    async def get_recent_message_history_for_user(
+            self, user_id: int, limit: int
+    ) -> list[UserMessageHistoryEntry]:
+        return await self.pool.read(lambda manager: manager.get_recent_message_history_for_user(user_id, limit))
+
+    async def get_user_summary(self, user_id: int, recent_limit: int = constants.PROFILE_RECENT_MESSAGES) -> UserSummary:
+        return await self.pool.read(lambda manager: manager.get_user_summary(user_id, recent_limit))
@@ -0,0 +1,15 @@
+"""shared bootstrap for the benchmark scripts, import it before anything from the bot
+
+puts the project root on sys.path, gives constants.py the token it insists on (a dummy one is fine here)
+and an absolute log file, objlog can't create a bare relative one in a fresh checkout.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DOA_DISCORD_BOT_TOKEN", "benchmark")
+# always our own file, benchmark runs shouldn't end up in the bot's log
+os.environ["DOA_LOG_FILE"] = os.path.join(tempfile.gettempdir(), "doa-benchmarks.log")
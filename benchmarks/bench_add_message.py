@@ -0,0 +1,66 @@
+"""benchmark: building a 10k message Conversation, append+sort vs sorted insert vs bulk extend
+
+usage: python benchmarks/bench_add_message.py
+"""
+
+import random
+import time
+
+import _setup  # noqa: F401, sets up the import path and environment
+import constants
+from classes import Message, Conversation, Person
+
+MESSAGE_COUNT = 10_000
+
+
+def build_messages(count: int) -> list[Message]:
+    author = Person(name="user0", nick=None, user_id="1000")
+    messages = []
+    for i in range(count):
+        message = Message(content=f"message number {i}", author=author)
+        message.timestamp = 1_700_000_000 + i
+        messages.append(message)
+    return messages
+
+
+def add_message_resort(conversation: Conversation, message: Message) -> None:
+    """the old add_message, kept here for comparison"""
+    conversation.messages.append(message)
+    conversation.messages.sort(key=lambda msg: msg.timestamp)
+
+
+def timed(build) -> float:
+    start = time.perf_counter()
+    build()
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    constants.MAIN_LOG.disable()
+    in_order = build_messages(MESSAGE_COUNT)
+    shuffled = in_order.copy()
+    random.Random(0).shuffle(shuffled)
+
+    def run(messages, add):
+        conversation = Conversation()
+        for message in messages:
+            add(conversation, message)
+        assert [m.timestamp for m in conversation.messages] == [m.timestamp for m in in_order]
+
+    def run_extend(messages):
+        conversation = Conversation()
+        conversation.extend(messages)
+        assert [m.timestamp for m in conversation.messages] == [m.timestamp for m in in_order]
+
+    print(f"{MESSAGE_COUNT} messages")
+    print(f"{'order':>9} | {'append+sort (ms)':>16} | {'add_message (ms)':>16} | {'extend (ms)':>11}")
+    for label, messages in (("in order", in_order), ("shuffled", shuffled)):
+        resort = timed(lambda: run(messages, add_message_resort))
+        insert = timed(lambda: run(messages, Conversation.add_message))
+        bulk = timed(lambda: run_extend(messages))
+        print(f"{label:>9} | {resort:>16.1f} | {insert:>16.1f} | {bulk:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
+    constants.MAIN_LOG.await_finish()
@@ -0,0 +1,79 @@
+"""benchmark: per-request latency against a local stub server, fresh connection per call vs the shared pooled session
+
+usage: python benchmarks/bench_http_session.py
+note: the stub is plain HTTP on localhost, so this only shows the TCP handshake savings.
+against REMOTE_SOURCE_URL the TLS handshake is skipped too, so the real gap is larger.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import _setup  # noqa: F401, sets up the import path and environment
+import constants
+import http_client
+
+REQUESTS = 300
+RESPONSE_BODY = json.dumps(
+    {"choices": [{"message": {"role": "assistant", "content": "hi :)"}}]}
+).encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    # headers and body go out in separate writes, without this nagle + delayed ACK adds ~40ms per reused connection
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(post, url: str) -> list[float]:
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "hello"}]}
+    timings = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        response = post(url, payload)
+        response.json()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(label: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    median = timings[len(timings) // 2] * 1000
+    p95 = timings[int(len(timings) * 0.95)] * 1000
+    print(f"{label:<24} median {median:6.3f} ms | p95 {p95:6.3f} ms")
+
+
+def main() -> None:
+    constants.REMOTE_LOG.disable()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+    before = run(lambda target, payload: requests.post(target, json=payload, timeout=10), url)
+    after = run(lambda target, payload: http_client.post("chat_completions", target, json=payload), url)
+
+    summarize("requests.post (before)", before)
+    summarize("shared session (after)", after)
+
+    server.shutdown()
+    http_client.close()
+
+
+if __name__ == "__main__":
+    main()
+    constants.MAIN_LOG.await_finish()
+    constants.REMOTE_LOG.await_finish()
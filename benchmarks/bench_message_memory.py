@@ -0,0 +1,57 @@
+"""benchmark: memory per message for a 100k message history
+
+usage: python benchmarks/bench_message_memory.py
+"""
+
+import tracemalloc
+import uuid
+
+import _setup  # noqa: F401, sets up the import path and environment
+import constants
+from classes import Message, ModerationResult, Person
+
+MESSAGE_COUNT = 100_000
+
+
+def build_loaded(count: int) -> list[Message]:
+    """messages the way the database loader builds them, every field filled in"""
+    messages = []
+    for i in range(count):
+        message = Message(
+            f"message number {i}",
+            author=Person(name=f"user{i % 50}", nick=None, user_id=str(1000 + i % 50)),
+        )
+        message.uuid = str(uuid.uuid4())
+        message.timestamp = 1_700_000_000 + i
+        message.moderation = ModerationResult(
+            flagged=False, moderated=True, categories=ModerationResult.Categories()
+        )
+        messages.append(message)
+    return messages
+
+
+def build_bare(count: int) -> list[Message]:
+    """messages that were constructed but never had their lazy fields touched"""
+    return [Message(f"message number {i}") for i in range(count)]
+
+
+def measure(build) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    messages = build(MESSAGE_COUNT)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del messages
+    return (after - before) / MESSAGE_COUNT
+
+
+def main() -> None:
+    constants.MAIN_LOG.disable()
+    print(f"{MESSAGE_COUNT} messages")
+    print(f"loaded from database: {measure(build_loaded):.0f} bytes/message")
+    print(f"constructed only:     {measure(build_bare):.0f} bytes/message")
+
+
+if __name__ == "__main__":
+    main()
+    constants.MAIN_LOG.await_finish()
@@ -0,0 +1,78 @@
+"""benchmark: per-reply save latency, append-only vs full rewrite
+
+usage: python benchmarks/bench_save_conversation.py
+"""
+
+import os
+import tempfile
+import time
+
+import _setup  # noqa: F401, sets up the import path and environment
+import constants
+import databases
+from classes import Message, AntonMessage, Conversation, Person, TextAttachment
+
+HISTORY_SIZES = [10, 100, 1000]
+REPLIES = 20
+
+
+def build_conversation(size: int) -> Conversation:
+    conversation = Conversation()
+    for i in range(size):
+        if i % 2:
+            message = AntonMessage(content=f"reply number {i} " * 8)
+        else:
+            message = Message(
+                content=f"message number {i} " * 8,
+                author=Person(name=f"user{i % 7}", nick=None, user_id=str(1000 + i % 7)),
+            )
+            if i % 10 == 0:
+                message.attachments.append(TextAttachment(filename="note.txt", data=b"x" * 4096))
+        message.timestamp = 1_700_000_000 + i
+        conversation.add_message(message)
+    return conversation
+
+
+def add_reply(conversation: Conversation, step: int) -> None:
+    user_message = Message(
+        content=f"new question {step}",
+        author=Person(name="user0", nick=None, user_id="1000"),
+    )
+    user_message.timestamp = 1_800_000_000 + step * 2
+    conversation.add_message(user_message)
+    bot_message = AntonMessage(content=f"new answer {step}")
+    bot_message.timestamp = 1_800_000_000 + step * 2 + 1
+    conversation.add_message(bot_message)
+
+
+def bench(size: int, compact: bool) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        users = databases.UsersDatabaseManager(os.path.join(tmp, "users.db"))
+        manager = databases.ConversationDatabaseManager(os.path.join(tmp, "DOA.db"), users_manager=users)
+        conversation = build_conversation(size)
+        manager.save_conversation(1, conversation, compact=True)
+
+        timings = []
+        for step in range(REPLIES):
+            add_reply(conversation, step)
+            start = time.perf_counter()
+            manager.save_conversation(1, conversation, compact=compact)
+            timings.append(time.perf_counter() - start)
+        manager.close()
+        users.close()
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main() -> None:
+    constants.MAIN_LOG.disable()
+    print(f"{'stored':>8} | {'rewrite (ms)':>12} | {'append (ms)':>11} | speedup")
+    for size in HISTORY_SIZES:
+        rewrite = bench(size, compact=True)
+        append = bench(size, compact=False)
+        print(f"{size:>8} | {rewrite:>12.2f} | {append:>11.2f} | {rewrite / append:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
+    constants.MAIN_LOG.await_finish()
@@ -0,0 +1,88 @@
+"""benchmark: /get_profile data, full history vs user_stats + recent messages
+
+also checks user_stats against a full recount after every kind of write (append, uuid conflict, compact,
+delete), so a trigger that misses a path shows up here.
+
+usage: python benchmarks/bench_user_stats.py
+"""
+
+import os
+import tempfile
+import time
+
+import _setup  # noqa: F401, sets up the import path and environment
+import constants
+import databases
+from classes import Message, Conversation, Person, ModerationResult
+
+HISTORY_SIZES = [100, 1000, 5000]
+USER_ID = 1000
+
+
+def build_message(i: int, uuid: str | None = None) -> Message:
+    message = Message(content=f"message number {i}", author=Person(name="user0", nick=None, user_id=str(USER_ID)))
+    message.timestamp = 1_700_000_000 + i
+    if uuid:
+        message.uuid = uuid
+    moderation = ModerationResult(flagged=i % 10 == 0, moderated=True)
+    moderation.categories.harassment = i % 20 == 0
+    message.moderation = moderation
+    return message
+
+
+def check_stats(manager: databases.ConversationDatabaseManager, after: str) -> None:
+    drift = manager.user_stats_drift()
+    assert not drift, f"user_stats out of sync after {after} for users {drift}"
+
+
+def timed(run, repeat: int = 5) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench(size: int) -> tuple[float, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        users = databases.UsersDatabaseManager(os.path.join(tmp, "users.db"))
+        manager = databases.ConversationDatabaseManager(os.path.join(tmp, "DOA.db"), users_manager=users)
+        conversation = Conversation()
+        conversation.extend(build_message(i) for i in range(size))
+        manager.save_conversation(1, conversation)
+        check_stats(manager, "the first save")
+
+        conversation.add_message(build_message(size))
+        manager.save_conversation(1, conversation)
+        check_stats(manager, "an append")
+
+        # same uuid in another channel, messages.uuid resolves that with ON CONFLICT REPLACE
+        duplicate = Conversation()
+        duplicate.add_message(build_message(size + 1, uuid=conversation.messages[0].uuid))
+        manager.save_conversation(2, duplicate)
+        check_stats(manager, "a uuid conflict")
+
+        conversation.messages = conversation.messages[size // 2:]
+        manager.save_conversation(1, conversation, compact=True)
+        check_stats(manager, "a compaction")
+
+        manager.delete_conversation(2)
+        check_stats(manager, "a delete")
+
+        history = timed(lambda: manager.get_user_history(USER_ID))
+        summary = timed(lambda: manager.get_user_summary(USER_ID))
+        manager.close()
+        users.close()
+    return history, summary
+
+
+def main() -> None:
+    constants.MAIN_LOG.disable()
+    print(f"{'messages':>8} | {'history (ms)':>12} | {'summary (ms)':>12}")
+    for size in HISTORY_SIZES:
+        history, summary = bench(size)
+        print(f"{size:>8} | {history:>12.2f} | {summary:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
+    constants.MAIN_LOG.await_finish()
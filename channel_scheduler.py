@@ -0,0 +1,63 @@
+"""per-channel serialization of bot replies, with a global cap on channels being answered at once"""
+
+import asyncio
+from typing import Awaitable, Callable
+
+import discord
+
+import constants
+from objlog.LogMessages import Debug, Error
+
+
+class ChannelScheduler:
+    """Queues mentions per channel and hands them to `handler` one batch at a time per channel.
+
+    A channel never has two replies in flight, so each one loads the conversation the previous one saved.
+    With `coalesce` on, mentions that pile up while a channel is busy (or within `coalesce_window` seconds of
+    the first one) are answered together by a single handler call of up to `max_batch` messages.
+    """
+
+    def __init__(
+            self,
+            handler: Callable[[list[discord.Message]], Awaitable[None]],
+            max_concurrent_channels: int = constants.MAX_CONCURRENT_CHANNELS,
+            coalesce: bool = constants.COALESCE_MENTIONS,
+            coalesce_window: float = constants.COALESCE_WINDOW_SECONDS,
+            max_batch: int = constants.COALESCE_MAX_BATCH,
+    ) -> None:
+        self.handler = handler
+        self.coalesce = coalesce
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch if coalesce else 1
+        self._semaphore = asyncio.Semaphore(max_concurrent_channels)
+        self._queues: dict[int, list[discord.Message]] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+
+    def submit(self, message: discord.Message) -> None:
+        channel_id = message.channel.id
+        self._queues.setdefault(channel_id, []).append(message)
+        if channel_id not in self._workers:
+            self._workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+
+    async def _drain(self, channel_id: int) -> None:
+        queue = self._queues[channel_id]
+        try:
+            while queue:
+                if self.coalesce and self.coalesce_window > 0:
+                    await asyncio.sleep(self.coalesce_window)  # let the rest of a burst arrive
+                async with self._semaphore:
+                    batch = queue[:self.max_batch]
+                    del queue[:self.max_batch]
+                    if len(batch) > 1:
+                        constants.MAIN_LOG.log(
+                            Debug(f"Answering {len(batch)} mentions in channel {channel_id} with one reply.")
+                        )
+                    try:
+                        await self.handler(batch)
+                    except Exception as e:
+                        constants.MAIN_LOG.log(Error(f"Error handling messages in channel {channel_id}"), e)
+        finally:
+            # nothing awaits between the empty check and here, so no message can slip in unnoticed
+            del self._workers[channel_id]
+            if not queue:
+                del self._queues[channel_id]
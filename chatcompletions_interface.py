@@ -1,10 +1,13 @@
 import base64
+import json
+from typing import Iterator
 
 # import objlog.utils
 
 import classes
 import constants
-import requests
+import context_window
+import http_client
 
 from objlog.LogMessages import Info, Debug, Error, Warn
 
@@ -30,20 +33,15 @@ class ChatCompletions(classes.Model):
         self.api_key = api_key
         self.source_url = api_source if api_source else self.source_url
 
-    # @objlog.utils.monitor(REMOTE_LOG, True, True)
-    def generate_response(
-            self, conversation: classes.Conversation
-    ) -> classes.AntonMessage:
-        """Generate a response using the chat/completions interface based on the conversation history."""
-        constants.REMOTE_LOG.log(
-            Info("Generating response using Chat Completions interface.")
-        )
-
-        # prepare headers
-        headers = {
+    def _headers(self) -> dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
+
+    def _build_payload(self, conversation: classes.Conversation) -> dict:
+        """Serialize the conversation into a chat/completions request body."""
+        conversation = context_window.fit_to_model(conversation, self.name)
         message_history = []
         for message in conversation.messages:
             if len(message.attachments) > 0:
@@ -133,19 +131,34 @@ class ChatCompletions(classes.Model):
 
         MAIN_LOG.log(Debug(f"Built message payload."))
 
+        system_messages = [{"role": "system", "content": constants.system_prompt()}]
+        summary = context_window.summary_prompt(conversation)
+        if summary:
+            system_messages.append({"role": "system", "content": summary})
+
         payload = {
             "model": self.name,
-            "messages": [{"role": "system", "content": constants.system_prompt()}]
-                        + message_history,
+            "messages": system_messages + message_history,
         }
 
         constants.REMOTE_LOG.log(Debug(f"Chat Completions request payload assembled"))
         # note: DON'T PRINT THE PAYLOAD, IT'S HUGE!
+        return payload
+
+    # @objlog.utils.monitor(REMOTE_LOG, True, True)
+    def generate_response(
+            self, conversation: classes.Conversation
+    ) -> classes.AntonMessage:
+        """Generate a response using the chat/completions interface based on the conversation history."""
+        constants.REMOTE_LOG.log(
+            Info("Generating response using Chat Completions interface.")
+        )
+        payload = self._build_payload(conversation)
         constants.REMOTE_LOG.log(
             Info(f"Sending request to Chat Completions API at {self.source_url}")
         )
-        response = requests.post(
-            self.source_url + "/v1/chat/completions", headers=headers, json=payload, timeout=constants.REMOTE_TIMEOUT_SECONDS
+        response = http_client.post(
+            "chat_completions", self.source_url + "/v1/chat/completions", headers=self._headers(), json=payload
         )
         if response.status_code != 200:
             constants.REMOTE_LOG.log(
@@ -167,12 +180,55 @@ class ChatCompletions(classes.Model):
             content=response_data["choices"][0]["message"]["content"]
         )
 
+    def stream_response(self, conversation: classes.Conversation) -> Iterator[str]:
+        """Stream the response as text deltas using server-sent events (stream: true)."""
+        constants.REMOTE_LOG.log(
+            Info("Streaming response using Chat Completions interface.")
+        )
+        payload = self._build_payload(conversation)
+        payload["stream"] = True
+        constants.REMOTE_LOG.log(
+            Info(f"Sending streaming request to Chat Completions API at {self.source_url}")
+        )
+        with http_client.post(
+                "chat_completions",
+                self.source_url + "/v1/chat/completions",
+                headers=self._headers(),
+                json=payload,
+                stream=True,
+        ) as response:
+            if response.status_code != 200:
+                constants.REMOTE_LOG.log(
+                    Error(
+                        f"Error from Chat Completions API: {response.status_code} - {response.text}"
+                    )
+                )
+                raise Exception(f"Chat Completions API error: {response.status_code}")
+            for raw_line in response.iter_lines():
+                # decode ourselves, text/event-stream without a charset would make requests guess latin-1
+                line = raw_line.decode("utf-8")
+                # SSE: blank lines separate events, lines starting with ":" are keep-alive comments
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("error"):
+                    constants.REMOTE_LOG.log(Error(f"Error while streaming from Chat Completions API: {chunk['error']}"))
+                    raise Exception("Chat Completions API stream error")
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+        constants.REMOTE_LOG.log(
+            Info("Finished streaming response from Chat Completions interface.")
+        )
+
     def basic_chat(self, message: str, appended_system_prompt: str | None = None) -> str:
         """A basic chat method that sends a single message and gets a response."""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
+        headers = self._headers()
 
         messages = [
             {"role": "system", "content": constants.system_prompt()}
@@ -181,14 +237,14 @@ class ChatCompletions(classes.Model):
             messages.append({"role": "system", "content": appended_system_prompt})
         messages.append({"role": "user", "content": [{"type": "text", "text": message}]})
 
-        response = requests.post(
+        response = http_client.post(
+            "chat_completions",
             self.source_url + "/v1/chat/completions",
             headers=headers,
             json={
                 "model": self.name,
                 "messages": messages
             },
-            timeout=constants.REMOTE_TIMEOUT_SECONDS
         )
 
         if response.status_code != 200:
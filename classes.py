@@ -2,29 +2,50 @@ from __future__ import annotations
 
 """classes for daughter of anton"""
 
-import datetime
+import asyncio
+import bisect
+import hashlib
+import time
 import uuid
-import requests
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
 
 import constants
+import http_client
+from wordlist import WordlistMatcher
 from constants import MAIN_LOG, REMOTE_LOG
 from objlog.LogMessages import Info, Warn, Error, Debug
 
+if TYPE_CHECKING:
+    from databases import ModerationCacheDatabaseManager
+
 
 # conversational classes
 
 class Person:
     """A person who wrote a message."""
 
+    __slots__ = ("name", "nick", "_id")
+
     name: str
-    id: str
-    nick: str | None = None
+    nick: str | None
 
     def __init__(self, name: str, nick: str | None = None, user_id: str | None = None) -> None:
         self.name = name
         self.nick = nick
-        self.id = user_id if user_id else str(uuid.uuid4())
+        self._id = user_id if user_id else None
+
+    @property
+    def id(self) -> str:
+        # people without a discord id get a random one, but only once something actually asks for it
+        if self._id is None:
+            self._id = str(uuid.uuid4())
+        return self._id
+
+    @id.setter
+    def id(self, value: str) -> None:
+        self._id = value
 
 
 @dataclass
@@ -37,6 +58,8 @@ class UserProfile:
     notes: str | None = None
     last_message_uuid: str | None = None
     last_seen_at: int | None = None
+    # user_stats.message_count when the notes were written, see profile_notes
+    notes_message_count: int | None = None
 
 
 @dataclass
@@ -72,6 +95,26 @@ class UserHistoryBundle:
     moderations: list[UserModerationHistoryEntry]
 
 
+@dataclass
+class UserStats:
+    """Aggregate counters for one user, kept up to date by the database (see user_stats)."""
+
+    user_id: int
+    message_count: int = 0
+    flagged_count: int = 0
+    # flagged moderations per category, keyed like MODERATION_CATEGORY_NAMES
+    category_counts: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class UserSummary:
+    """What a profile view needs: profile, aggregate stats and the most recent messages."""
+
+    profile: UserProfile | None
+    stats: UserStats
+    recent_messages: list[UserMessageHistoryEntry]
+
+
 class Person_Profile:
     """Backward-compatible alias for legacy code paths."""
 
@@ -88,6 +131,8 @@ class Person_Profile:
 class DaughterOfAnton(Person):
     """Daughter of anton's specific class."""
 
+    __slots__ = ()
+
     def __init__(self) -> None:
         super().__init__(name="Daughter of Anton")
 
@@ -95,15 +140,45 @@ class DaughterOfAnton(Person):
 # attachments
 
 class Attachment:
-    """An attachment to a message."""
+    """An attachment to a message.
+
+    `data` may be deferred (see defer_data), in which case the bytes are only fetched the first time they're read.
+    `filename`, `size` and the rest of the metadata are always available.
+    """
 
     filename: str
-    data: bytes
+    size: int
+    blob_hash: str | None  # key of the bytes in the attachment blob store, once known
 
-    def __init__(self, filename: str, data: bytes) -> None:
+    def __init__(self, filename: str, data: bytes | None) -> None:
         self.filename = filename
         self.data = data
 
+    @property
+    def data(self) -> bytes | None:
+        if self._loader is not None:
+            self._data = self._loader()
+            self._loader = None
+        return self._data
+
+    @data.setter
+    def data(self, value: bytes | None) -> None:
+        self._data = value
+        self._loader = None
+        self.size = len(value) if value is not None else 0
+        self.blob_hash = None
+
+    @property
+    def data_loaded(self) -> bool:
+        return self._loader is None
+
+    def defer_data(self, loader: Callable[[], bytes | None], size: int, blob_hash: str | None = None) -> None:
+        """Replace the bytes with `loader`, which is called (once) when data is first read."""
+        self._data = None
+        self._loader = loader
+        self.size = size
+        self.blob_hash = blob_hash
+
 
 class ImageAttachment(Attachment):
     """An image attachment to a message."""
@@ -148,27 +223,73 @@ class PDFAttachment(Attachment):
         super().__init__(filename, data)
 
 
+class _CategoryFlag:
+    """bool attribute of ModerationResult.Categories, stored as one bit of its flags int"""
+
+    __slots__ = ("bit",)
+
+    def __init__(self, bit: int) -> None:
+        self.bit = bit
+
+    def __get__(self, instance: ModerationResult.Categories | None, owner: type) -> bool | _CategoryFlag:
+        if instance is None:
+            return self
+        return bool(instance.flags & self.bit)
+
+    def __set__(self, instance: ModerationResult.Categories, value: bool) -> None:
+        if value:
+            instance.flags |= self.bit
+        else:
+            instance.flags &= ~self.bit
+
+
+# order matters, it's the order flagged categories are reported in
+MODERATION_CATEGORY_NAMES = (
+    "harassment",
+    "harassment_threats",
+    "sexual_content",
+    "hate",
+    "hate_threat",
+    "illicit",
+    "illicit_violent",
+    "self_harm_intent",
+    "self_harm_instruction",
+    "self_harm",
+    "sexual_minors",
+    "violence",
+    "violence_graphic",
+)
+
+
 class ModerationResult:
     """A moderation result for a message."""
 
+    __slots__ = ("flagged", "moderated", "categories")
+
     flagged: bool
-    moderated: bool = False  # if the message has even been moderated yet
+    moderated: bool  # if the message has even been moderated yet
 
     class Categories:
-        harassment: bool
-        harassment_threats: bool
-        sexual_content: bool
-        hate: bool
-        hate_threat: bool
-        illicit: bool
-        illicit_violent: bool
-        self_harm_intent: bool
-        self_harm_instruction: bool
-        self_harm: bool
-        sexual_minors: bool
-        violence: bool
-        violence_graphic: bool
-        banned_word: str | None = None
+        """flagged moderation categories, packed into a single int (see MODERATION_CATEGORY_NAMES)"""
+
+        __slots__ = ("flags", "banned_word")
+
+        flags: int
+        banned_word: str | None
+
+        harassment = _CategoryFlag(1 << 0)
+        harassment_threats = _CategoryFlag(1 << 1)
+        sexual_content = _CategoryFlag(1 << 2)
+        hate = _CategoryFlag(1 << 3)
+        hate_threat = _CategoryFlag(1 << 4)
+        illicit = _CategoryFlag(1 << 5)
+        illicit_violent = _CategoryFlag(1 << 6)
+        self_harm_intent = _CategoryFlag(1 << 7)
+        self_harm_instruction = _CategoryFlag(1 << 8)
+        self_harm = _CategoryFlag(1 << 9)
+        sexual_minors = _CategoryFlag(1 << 10)
+        violence = _CategoryFlag(1 << 11)
+        violence_graphic = _CategoryFlag(1 << 12)
 
         def __init__(self, harassment: bool = False, harassment_threats: bool = False, sexual_content: bool = False,
                      hate: bool = False, hate_threat: bool = False, illicit: bool = False,
@@ -176,64 +297,101 @@ class ModerationResult:
                      self_harm_instruction: bool = False, self_harm: bool = False,
                      sexual_minors: bool = False, violence: bool = False,
                      violence_graphic: bool = False, banned_word: str | None = None) -> None:
-            self.harassment = harassment
-            self.harassment_threats = harassment_threats
-            self.sexual_content = sexual_content
-            self.hate = hate
-            self.hate_threat = hate_threat
-            self.illicit = illicit
-            self.illicit_violent = illicit_violent
-            self.self_harm_intent = self_harm_intent
-            self.self_harm_instruction = self_harm_instruction
-            self.self_harm = self_harm
-            self.sexual_minors = sexual_minors
-            self.violence = violence
-            self.violence_graphic = violence_graphic
+            values = (harassment, harassment_threats, sexual_content, hate, hate_threat, illicit, illicit_violent,
+                      self_harm_intent, self_harm_instruction, self_harm, sexual_minors, violence, violence_graphic)
+            self.flags = sum(1 << bit for bit, value in enumerate(values) if value)
             self.banned_word = banned_word
 
         def get_flagged_categories(self) -> list[str]:
-            flagged = []
-            for category, value in vars(self).items():
-                if value is True:
-                    flagged.append(category)
-            return flagged
-
+            return [name for bit, name in enumerate(MODERATION_CATEGORY_NAMES) if self.flags & (1 << bit)]
 
     categories: Categories
 
-    def __init__(self, flagged: bool, categories: Categories, moderated: bool = False) -> None:
+    def __init__(self, flagged: bool, categories: Categories | None = None, moderated: bool = False) -> None:
         self.flagged = flagged
         self.moderated = moderated
-        self.categories = categories
+        self.categories = categories if categories is not None else ModerationResult.Categories()
 
     def reasons_as_string(self) -> str:
         return ", ".join(self.categories.get_flagged_categories())
 
+    def copy(self) -> ModerationResult:
+        """a copy that can be claimed and filled in without touching this one"""
+        categories = ModerationResult.Categories(banned_word=self.categories.banned_word)
+        categories.flags = self.categories.flags
+        return ModerationResult(self.flagged, categories, self.moderated)
+
 
 class Message:
     """A message written by a person."""
 
+    # author, uuid and moderation are only built when first read, most messages get them overwritten
+    # from a database row or a discord message right after construction anyway
+    __slots__ = ("content", "_author", "timestamp", "context", "reference", "attachments", "_uuid", "_moderation")
+
     content: str
-    author: Person
     timestamp: float
     context: bool
-    moderation: ModerationResult | None = None
-    reference: Message | None = None
-    attachments: list[Attachment] = []
-    uuid: str
+    reference: Message | None
+    attachments: list[Attachment]
 
     def __init__(self, content: str = "", author: Person | None = None, context: bool = False,
                  reference: Message | None = None) -> None:
         self.content = content
-        self.author = author if author else Person(name="Unknown")
-        self.timestamp = datetime.datetime.timestamp(datetime.datetime.now())
+        self._author = author
+        self.timestamp = time.time()
         self.context = context
         self.reference = reference
-        self.uuid = str(uuid.uuid4())
+        self._uuid = None
         self.attachments = []  # initialize attachments as empty list (prevent shared mutable default,
         # i'm so stupid for not catching this earlier)
-        self.moderation = ModerationResult(flagged=False, moderated=False,
-                                         categories=ModerationResult.Categories())  # default moderation result
+        self._moderation = None
+
+    @property
+    def author(self) -> Person:
+        if self._author is None:
+            self._author = Person(name="Unknown")
+        return self._author
+
+    @author.setter
+    def author(self, value: Person | None) -> None:
+        self._author = value
+
+    @property
+    def uuid(self) -> str:
+        if self._uuid is None:
+            self._uuid = str(uuid.uuid4())
+        return self._uuid
+
+    @uuid.setter
+    def uuid(self, value: str | None) -> None:
+        self._uuid = value
+
+    @property
+    def moderation(self) -> ModerationResult:
+        if self._moderation is None:
+            self._moderation = ModerationResult(flagged=False, moderated=False)  # default moderation result
+        return self._moderation
+
+    @moderation.setter
+    def moderation(self, value: ModerationResult | None) -> None:
+        self._moderation = value
+
+    def copy(self) -> Message:
+        """Shallow copy with its own moderation result and attachment list, the author and reference are shared.
+
+        the uuid is fixed on this message first, so every copy of it is stored as the same message.
+        """
+        copy = object.__new__(type(self))
+        copy.content = self.content
+        copy._author = self._author
+        copy.timestamp = self.timestamp
+        copy.context = self.context
+        copy.reference = self.reference
+        copy.attachments = self.attachments.copy()
+        copy._uuid = self.uuid
+        copy._moderation = self._moderation.copy() if self._moderation is not None else None
+        return copy
 
     def string_no_reply(self):
         nick = f"\\/\\{self.author.nick}" if self.author.nick else ""
@@ -255,141 +413,235 @@ class Message:
 class AntonMessage(Message):
     """A message written by Daughter of Anton."""
 
+    __slots__ = ()
+
     def __init__(self, content: str) -> None:
-        super().__init__()
-        self.content = content
-        self.timestamp = datetime.datetime.timestamp(datetime.datetime.now())
-        self.context = False
-        self.author = DaughterOfAnton()
+        super().__init__(content, author=DaughterOfAnton())
+
+
+def _message_timestamp(message: Message) -> float:
+    return message.timestamp
 
 
 class Conversation:
     """A conversation consisting of multiple messages."""
 
     messages: list[Message]
+    summary: str | None  # rolling summary of older history that is no longer loaded as messages
 
     def __init__(self) -> None:
         self.messages = []
+        self.summary = None
 
     def add_message(self, message: Message) -> None:
         """add a message and automatically place it according to timestamp"""
-        self.messages.append(message)
-        self.messages.sort(key=lambda msg: msg.timestamp)
+        if not self.messages or self.messages[-1].timestamp <= message.timestamp:
+            # newer than everything we have, which is nearly always the case
+            self.messages.append(message)
+        else:
+            # lands after any messages with the same timestamp, same as appending and stable-sorting would
+            bisect.insort_right(self.messages, message, key=_message_timestamp)
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        """add many messages at once, sorting only once at the end"""
+        self.messages.extend(messages)
+        self.messages.sort(key=_message_timestamp)
+
+    def find_message(self, message_uuid: str) -> Message | None:
+        """the message with this uuid, if it's part of the conversation"""
+        for message in reversed(self.messages):  # lookups are nearly always for recent messages
+            if message.uuid == message_uuid:
+                return message
+        return None
 
     def clear_context(self) -> None:
         """clear all messages marked as context"""
         self.messages = [msg for msg in self.messages if not msg.context]
 
-    def run_moderations(self, api_key: str, moderation_url: str) -> None:
+    def _claim_unmoderated(self) -> list[Message]:
+        """return messages that still need moderation, marking them so nobody else picks them up"""
+        # message.moderation is only set for messages that have already been moderated, don't re-moderate those
+        messages_to_moderate = []
+        for msg in self.messages:
+            if not msg.moderation.moderated and not isinstance(msg, AntonMessage):
+                msg.moderation.moderated = True  # mark as moderated to prevent re-moderation
+                messages_to_moderate.append(msg)
+        # rest of types are ignored for moderation for now (unsupported)
+        return messages_to_moderate
+
+    def run_moderations(self, api_key: str, moderation_url: str,
+                        cache: ModerationCacheDatabaseManager | None = None) -> None:
         """run moderation on all messages in the conversation IF they haven't been moderated yet"""
         if constants.ENABLE_MODERATION:
             constants.REMOTE_LOG.log(Info("Starting moderation check for conversation."))
-            # run messages through moderation endpoint
-            # message.moderation is only set for messages that have already been moderated, don't re-moderate those
-            # messages_to_moderate contains the self.messages's indexes that need moderation
-            messages_to_moderate = []
-            for i, msg in enumerate(self.messages):
-                if not msg.moderation.moderated and not isinstance(msg, AntonMessage):
-                    msg.moderation.moderated = True  # mark as moderated to prevent re-moderation
-                    messages_to_moderate.append(i) # store index for later use, so we can modify the original messages later
-            # rest of types are ignored for moderation for now (unsupported)
-
-            # look for words in the wordlist first
-            for word in constants.MODERATION_WORDLIST:
-                for msg_index in messages_to_moderate:
-                    if word in self.messages[msg_index].content.lower():
-                        constants.REMOTE_LOG.log(
-                            Warn("Message flagged by wordlist moderation."),
-                            Warn(f"Flagged word: {word}")
-                        )
-                        self.messages[msg_index].moderation.flagged = True
-                        self.messages[msg_index].moderation.Categories.banned_word = word
-
-            # jsonify!
-            jsonfied_messages = []
-            message_sizes = []
-
-            constants.REMOTE_LOG.log(Info(f"Moderating {len(messages_to_moderate)} messages."))
-
-            for msg_index in messages_to_moderate:
-                size = 1
-                if not self.messages[msg_index].moderation.flagged:
-                    msg_json = {
-                        "type": "text",
-                        "text": self.messages[msg_index].content
-                    }
-                    messages_to_moderate_json = [msg_json]
-                    for attachment in self.messages[msg_index].attachments:
-                        # only text attachments are supported for moderation for now
-                        if isinstance(attachment, TextAttachment):
-                            messages_to_moderate_json.append({
-                                "type": "text",
-                                "text": attachment.data.decode('utf-8')
-                            })
-                        elif isinstance(attachment, ImageAttachment):
-                            messages_to_moderate_json.append({
-                                "type": "image_url",
-                                "image_url": {"url": attachment.url}
-                            })
-                        size += 1  # attachments also count towards size
-                    for _ in range(size):
-                        message_sizes.append(msg_index)
-
-                    jsonfied_messages.append(messages_to_moderate_json)
-
-            # flatten the list
-            # each attachment is a separate input to moderation endpoint
-            new_messages_to_moderate = []
-            for msg_list in jsonfied_messages:
-                for msg in msg_list:
-                    new_messages_to_moderate.append(msg)
-
-            REMOTE_LOG.log(Info(f"Sending {len(new_messages_to_moderate)} items to Moderations API for moderation."))
-
-            response = requests.post(
-                moderation_url + "/v1/moderations",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={"input": new_messages_to_moderate},
-                timeout=constants.REMOTE_TIMEOUT_SECONDS
+            moderate_messages(self._claim_unmoderated(), api_key, moderation_url, cache)
+
+    def run_moderations_async(self, api_key: str, moderation_url: str,
+                              cache: ModerationCacheDatabaseManager | None = None) -> asyncio.Future | None:
+        """same as run_moderations, but the API call runs on the moderation executor instead of the event loop
+
+        the messages to moderate are claimed right here, before this returns (not when the returned future is
+        first awaited), so messages added to the conversation afterwards (context messages etc.) are never part
+        of this pass. returns the future to await, or None with moderation disabled. needs a running loop.
+        """
+        if not constants.ENABLE_MODERATION:
+            return None
+        constants.REMOTE_LOG.log(Info("Starting moderation check for conversation."))
+        messages_to_moderate = self._claim_unmoderated()
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(
+            MODERATION_EXECUTOR, moderate_messages, messages_to_moderate, api_key, moderation_url, cache
+        )
+
+
+# moderation runs here so a slow Moderations API call never blocks the discord event loop
+MODERATION_EXECUTOR = ThreadPoolExecutor(
+    max_workers=constants.MODERATION_WORKERS, thread_name_prefix="doa-moderation"
+)
+
+
+# banned words are checked locally before anything goes to the Moderations API
+WORDLIST_MATCHER = WordlistMatcher()
+
+
+def moderation_cache_key(kind: str, data: bytes) -> str:
+    """content hash used to look up moderation results in the moderation cache"""
+    return f"{kind}:{hashlib.sha256(data).hexdigest()}"
+
+
+def moderate_messages(messages_to_moderate: list[Message], api_key: str, moderation_url: str,
+                      cache: ModerationCacheDatabaseManager | None = None) -> None:
+    """run the wordlist and the Moderations API over the given messages, updating their moderation in place
+
+    if a moderation cache is given, inputs whose content hash is already cached skip the API entirely.
+    """
+    if not messages_to_moderate:
+        constants.REMOTE_LOG.log(Info("No new messages to moderate."))
+        return
+    started = time.perf_counter()
+
+    # look for words in the wordlist first, in the message and its text attachments
+    WORDLIST_MATCHER.reload_if_changed()
+    for message in messages_to_moderate:
+        word = WORDLIST_MATCHER.find(message.content)
+        if word is None:
+            for attachment in message.attachments:
+                if isinstance(attachment, TextAttachment):
+                    word = WORDLIST_MATCHER.find(attachment.data.decode("utf-8", errors="replace"))
+                    if word is not None:
+                        break
+        if word is not None:
+            constants.REMOTE_LOG.log(
+                Warn("Message flagged by wordlist moderation."),
+                Warn(f"Flagged word: {word}")
+            )
+            message.moderation.flagged = True
+            message.moderation.categories.banned_word = word
+
+    # jsonify! every input item remembers which message it belongs to and its cache key
+    moderation_inputs: list[tuple[Message, dict, str]] = []
+
+    constants.REMOTE_LOG.log(Info(f"Moderating {len(messages_to_moderate)} messages."))
+
+    for message in messages_to_moderate:
+        if message.moderation.flagged:
+            continue
+        moderation_inputs.append((
+            message,
+            {"type": "text", "text": message.content},
+            moderation_cache_key("text", message.content.encode("utf-8")),
+        ))
+        for attachment in message.attachments:
+            # only text and image attachments are supported for moderation for now
+            if isinstance(attachment, TextAttachment):
+                moderation_inputs.append((
+                    message,
+                    {"type": "text", "text": attachment.data.decode('utf-8')},
+                    moderation_cache_key("text", attachment.data),
+                ))
+            elif isinstance(attachment, ImageAttachment):
+                moderation_inputs.append((
+                    message,
+                    {"type": "image_url", "image_url": {"url": attachment.url}},
+                    moderation_cache_key("image", attachment.data or attachment.url.encode("utf-8")),
+                ))
+
+    cached_results = cache.get_many([key for _, _, key in moderation_inputs]) if cache else {}
+    # each distinct uncached input is sent once, repeated copypasta in one batch shares a result
+    inputs_to_send: dict[str, dict] = {}
+    for _, item, key in moderation_inputs:
+        if key not in cached_results:
+            inputs_to_send.setdefault(key, item)
+
+    if cache:
+        constants.REMOTE_LOG.log(
+            Info(
+                f"Moderation cache: {len(moderation_inputs) - len(inputs_to_send)} of {len(moderation_inputs)} "
+                f"items served from cache (lifetime {cache.hits} hits / {cache.misses} misses)."
             )
-            constants.REMOTE_LOG.log(Info("Sent moderation request to Moderations API."))
-            if response.status_code != 200:
-                constants.REMOTE_LOG.log(
-                    Error(
-                        f"Error from Moderations API: {response.status_code} - {response.text}"
-                    )
+        )
+
+    fresh_results: dict[str, dict] = {}
+    if inputs_to_send:
+        REMOTE_LOG.log(Info(f"Sending {len(inputs_to_send)} items to Moderations API for moderation."))
+
+        response = http_client.post(
+            "moderations",
+            moderation_url + "/v1/moderations",
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            json={"input": list(inputs_to_send.values())},
+        )
+        constants.REMOTE_LOG.log(Info("Sent moderation request to Moderations API."))
+        if response.status_code != 200:
+            constants.REMOTE_LOG.log(
+                Error(
+                    f"Error from Moderations API: {response.status_code} - {response.text}"
                 )
-                raise Exception(f"Moderations API error: {response.status_code}")
-            constants.REMOTE_LOG.log(Info("Received response from Moderations API."))
-            results = response.json()["results"]
-            MAIN_LOG.log(Debug(f"Moderation results: {results}"))
-            for index, result in enumerate(results):
-                msg_index = message_sizes[index]
-                # note: only override if false, if true but new result is false, keep true
-                if result["flagged"]:
-                    self.messages[msg_index].moderation.flagged = True
-                    self.messages[msg_index].moderation.categories.harassment = result["categories"]["harassment"] if not self.messages[msg_index].moderation.categories.harassment else True
-                    self.messages[msg_index].moderation.categories.harassment_threats = result["categories"]["harassment/threatening"] if not self.messages[msg_index].moderation.categories.harassment_threats else True
-                    self.messages[msg_index].moderation.categories.sexual_content = result["categories"]["sexual"] if not self.messages[msg_index].moderation.categories.sexual_content else True
-                    self.messages[msg_index].moderation.categories.hate = result["categories"]["hate"] if not self.messages[msg_index].moderation.categories.hate else True
-                    self.messages[msg_index].moderation.categories.hate_threat = result["categories"]["hate/threatening"] if not self.messages[msg_index].moderation.categories.hate_threat else True
-                    self.messages[msg_index].moderation.categories.illicit = result["categories"]["illicit"] if not self.messages[msg_index].moderation.categories.illicit else True
-                    self.messages[msg_index].moderation.categories.illicit_violent = result["categories"]["illicit/violent"] if not self.messages[msg_index].moderation.categories.illicit_violent else True
-                    self.messages[msg_index].moderation.categories.self_harm_intent = result["categories"]["self-harm/intent"] if not self.messages[msg_index].moderation.categories.self_harm_intent else True
-                    self.messages[msg_index].moderation.categories.self_harm_instruction = result["categories"]["self-harm/instructions"] if not self.messages[msg_index].moderation.categories.self_harm_instruction else True
-                    self.messages[msg_index].moderation.categories.self_harm = result["categories"]["self-harm"] if not self.messages[msg_index].moderation.categories.self_harm else True
-                    self.messages[msg_index].moderation.categories.sexual_minors = result["categories"]["sexual/minors"] if not self.messages[msg_index].moderation.categories.sexual_minors else True
-                    self.messages[msg_index].moderation.categories.violence = result["categories"]["violence"] if not self.messages[msg_index].moderation.categories.violence else True
-                    self.messages[msg_index].moderation.categories.violence_graphic = result["categories"]["violence/graphic"] if not self.messages[msg_index].moderation.categories.violence_graphic else True
-                    constants.REMOTE_LOG.log(
-                        Warn("Message flagged by Moderations API."),
-                        Warn(f"Flagged categories: {self.messages[msg_index].moderation.categories.get_flagged_categories()}")
-                    )
-                else:
-                    constants.REMOTE_LOG.log(Info("No moderation flags detected, clear to proceed."))
+            )
+            raise Exception(f"Moderations API error: {response.status_code}")
+        constants.REMOTE_LOG.log(Info("Received response from Moderations API."))
+        results = response.json()["results"]
+        MAIN_LOG.log(Debug(f"Moderation results: {results}"))
+        fresh_results = dict(zip(inputs_to_send.keys(), results))
+        if cache:
+            cache.put_many(fresh_results)
+
+    for message, _, key in moderation_inputs:
+        result = cached_results[key] if key in cached_results else fresh_results[key]
+        moderation = message.moderation
+        # note: only override if false, if true but new result is false, keep true
+        if result["flagged"]:
+            moderation.flagged = True
+            moderation.categories.harassment = result["categories"]["harassment"] if not moderation.categories.harassment else True
+            moderation.categories.harassment_threats = result["categories"]["harassment/threatening"] if not moderation.categories.harassment_threats else True
+            moderation.categories.sexual_content = result["categories"]["sexual"] if not moderation.categories.sexual_content else True
+            moderation.categories.hate = result["categories"]["hate"] if not moderation.categories.hate else True
+            moderation.categories.hate_threat = result["categories"]["hate/threatening"] if not moderation.categories.hate_threat else True
+            moderation.categories.illicit = result["categories"]["illicit"] if not moderation.categories.illicit else True
+            moderation.categories.illicit_violent = result["categories"]["illicit/violent"] if not moderation.categories.illicit_violent else True
+            moderation.categories.self_harm_intent = result["categories"]["self-harm/intent"] if not moderation.categories.self_harm_intent else True
+            moderation.categories.self_harm_instruction = result["categories"]["self-harm/instructions"] if not moderation.categories.self_harm_instruction else True
+            moderation.categories.self_harm = result["categories"]["self-harm"] if not moderation.categories.self_harm else True
+            moderation.categories.sexual_minors = result["categories"]["sexual/minors"] if not moderation.categories.sexual_minors else True
+            moderation.categories.violence = result["categories"]["violence"] if not moderation.categories.violence else True
+            moderation.categories.violence_graphic = result["categories"]["violence/graphic"] if not moderation.categories.violence_graphic else True
+            constants.REMOTE_LOG.log(
+                Warn("Message flagged by Moderations API."),
+                Warn(f"Flagged categories: {moderation.categories.get_flagged_categories()}")
+            )
+        else:
+            constants.REMOTE_LOG.log(Info("No moderation flags detected, clear to proceed."))
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    constants.REMOTE_LOG.log(
+        Info(
+            f"Moderation took {elapsed_ms:.0f} ms for {len(messages_to_moderate)} messages "
+            f"({elapsed_ms / len(messages_to_moderate):.0f} ms per message)."
+        )
+    )
 
 
 class Model:
@@ -404,5 +656,9 @@ class Model:
     def generate_response(self, conversation: Conversation) -> AntonMessage:
         raise NotImplementedError("Subclasses must implement this method.")
 
+    def stream_response(self, conversation: Conversation) -> Iterator[str]:
+        """yield the response as text chunks, models without streaming support yield it in one go"""
+        yield self.generate_response(conversation).content
+
     def basic_chat(self, message: str, appended_system_prompt: str | None = None) -> str:
         raise NotImplementedError("Subclasses must implement this method.")
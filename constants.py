@@ -2,6 +2,7 @@
 
 import os
 import platform
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
@@ -19,10 +20,19 @@ env_path = Path(__file__).resolve().parent / ".env"
 if env_path.exists():
     load_dotenv(dotenv_path=env_path)
 
-LOG_FILE = "doa.log"
+LOG_FILE = os.getenv("DOA_LOG_FILE", "doa.log")
 DATABASE_FILE = "DOA.db"
 CACHE_DATABASE_FILE = "cache.db"
 USERS_DATABASE_FILE = "users.db"
+DATABASE_READ_CONNECTIONS = 4  # size of the read connection pool used by async_databases
+PROFILE_RECENT_MESSAGES = 8  # latest messages /get_profile shows the model when writing profile notes
+# keep DOA.db and users.db on one connection (users.db ATTACHed) so a save is one transaction across both
+UNIFIED_STORAGE = False
+# cross-file commits are only atomic with a rollback journal, WAL (the default otherwise) doesn't guarantee it
+UNIFIED_STORAGE_JOURNAL_MODE = "TRUNCATE"
+DATABASE_MMAP_SIZE = 256 * 1024 * 1024  # bytes of each database file SQLite may memory-map for reads
+CONVERSATION_CACHE_MAX_CHANNELS = 256  # conversations kept in memory in front of the database
+CONVERSATION_CACHE_MAX_BYTES = 256 * 1024 * 1024  # rough memory cap for those, attachments included
 
 MAIN_LOG = LogNode("MAIN", log_file=LOG_FILE, print_to_console=True, asynchronous=True)
 OLLAMA_LOG = LogNode("OLLAMA", log_file=LOG_FILE, print_to_console=True, asynchronous=True)
@@ -31,7 +41,33 @@ REMOTE_LOG = LogNode("REMOTE", log_file=LOG_FILE, print_to_console=True, asynchr
 OLLAMA_MODEL_NAME = "deepseek-r1:8b"
 REMOTE_MODEL_NAME = "google/gemini-3-flash-preview"
 
+# approximate token budget for the chat history sent to each model (system prompt not included),
+# older messages past the budget are left out of the request but stay in the database
+CONTEXT_TOKEN_BUDGETS = {
+    REMOTE_MODEL_NAME: 24_000,
+    OLLAMA_MODEL_NAME: 6_000,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 8_000
+
+# once a channel has more stored messages than this, the oldest ones get folded into a rolling summary
+SUMMARY_TRIGGER_MESSAGES = 150
+SUMMARY_FOLD_MESSAGES = 100  # how many of the oldest messages go into one summary update
+
+PROFILE_NOTES_REFRESH_MESSAGES = 25  # new messages from a user before their profile notes count as outdated
+PROFILE_NOTES_MIN_INTERVAL_SECONDS = 30  # at most one profile notes model call per this many seconds
+
 REMOTE_TIMEOUT_SECONDS = 600  # 10 minutes, some AI models take a while to respond
+REMOTE_CONNECT_TIMEOUT_SECONDS = 10
+
+# (connect, read) timeouts per remote endpoint, used by http_client
+REMOTE_TIMEOUTS = {
+    "chat_completions": (REMOTE_CONNECT_TIMEOUT_SECONDS, REMOTE_TIMEOUT_SECONDS),
+    "responses": (REMOTE_CONNECT_TIMEOUT_SECONDS, REMOTE_TIMEOUT_SECONDS),
+    "moderations": (REMOTE_CONNECT_TIMEOUT_SECONDS, 60),  # moderation is quick, don't hang a reply on it
+}
+
+REMOTE_HTTP_POOL_CONNECTIONS = 4  # number of hosts to keep connection pools for
+REMOTE_HTTP_POOL_SIZE = 10  # keep-alive connections kept per host
 
 DOA_FEATURE_FLAGS = {
     "image_support": True,
@@ -41,7 +77,23 @@ DOA_FEATURE_FLAGS = {
     "pdf_support": True,
 }
 
+# stream model output into discord, editing the reply as tokens arrive
+STREAM_RESPONSES = True
+STREAM_EDIT_INTERVAL_SECONDS = 1.2  # discord allows ~5 edits per 5s per channel, stay under it
+
+CONTEXT_MESSAGE_LIMIT = 10  # recent channel messages pulled in as context for a guild reply
+CONTEXT_FETCH_CONCURRENCY = 4  # context messages converted (reference fetch, attachment reads) at once
+MAX_CONCURRENT_CHANNELS = 4  # channels being answered at the same time, replies within a channel are serialized
+COALESCE_MENTIONS = True  # answer mentions that pile up in a busy channel with a single reply
+COALESCE_WINDOW_SECONDS = 0.0  # extra wait for the rest of a burst before answering (0 = only what's queued)
+COALESCE_MAX_BATCH = 5  # most mentions answered by one reply
+DISCORD_MESSAGE_CACHE_MAX_ENTRIES = 5000  # discord messages (and their conversions) kept to skip fetch_message
+DISCORD_MESSAGE_CACHE_TTL_SECONDS = 15 * 60
+
 ENABLE_MODERATION = True
+MODERATION_WORKERS = 4  # threads available for concurrent Moderations API calls
+MODERATION_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # cached moderation results expire after a week
+MODERATION_CACHE_MAX_ENTRIES = 50_000  # least recently used results are evicted past this
 
 # other than these words (ones that aren't caught by v1/moderations), all messages are passed through to
 # v1/moderations for content filtering
@@ -51,6 +103,9 @@ MODERATION_WORDLIST = [
     "disestablishmentarianism",  # lmao
     "reggin" # i cant trust people
 ]
+# optional file with more banned terms (one per line, # comments), re-read when it changes, no restart needed
+MODERATION_WORDLIST_FILE = os.getenv("DOA_MODERATION_WORDLIST_FILE", None)
+MODERATION_WORDLIST_CHECK_SECONDS = 10  # how often the wordlist file is checked for changes
 
 DISCORD_BOT_TOKEN = os.getenv("DOA_DISCORD_BOT_TOKEN", None)
 REMOTE_AUTH_API_KEY = os.getenv("DOA_REMOTE_API_KEY", None)
@@ -60,31 +115,33 @@ REMOTE_SOURCE_URL = "https://ai.hackclub.com/proxy"
 BOOTUP_TIME = datetime.now()
 
 
-def system_prompt():
-    """Generate the system prompt with dynamic data."""
+SYSTEM_STATS_REFRESH_SECONDS = 300  # how often the slow system stats in the system prompt are refreshed
+
+FIRST_BOOT_TIME = datetime(2025, 10, 28, 1, 0)
 
-    how_old_in_years_months_days = lambda total_days: (
-        total_days // 365,
-        (total_days % 365) // 30,
-        (total_days % 365) % 30,
-    )
-    old_in_years, old_in_months, old_in_days = how_old_in_years_months_days(
-        (datetime.now() - datetime(2025, 10, 28, 1, 0)).days
-    )
 
-    # get day like "Monday, January 1, 2024"
-    current_day_verbose = time.strftime("%A, %B %d, %Y", time.localtime())
+class SystemPromptTemplate:
+    """The system prompt, split into a static prefix built once and a small dynamic tail.
 
-    delta_since_boot = datetime.now() - BOOTUP_TIME
-    total_uptime_seconds = int(delta_since_boot.total_seconds())
-    uptime_hours = total_uptime_seconds // 3600
-    uptime_minutes = (total_uptime_seconds % 3600) // 60
-    uptime_seconds = total_uptime_seconds % 60
+    Hardware/platform facts are computed on first use, slow-changing stats (disk space) are refreshed by a
+    background thread, and only the clock-based fields are filled in per request. Keeping everything that
+    changes at the very end gives providers a stable prefix to cache.
+    """
 
-    cpu_freq = psutil.cpu_freq()
-    cpu_freq_max = cpu_freq.max if cpu_freq else "unknown"
+    # always the prompt's last line, after the dynamic tail, so the model's final guidance stays the same
+    CLOSING = "Stay friendly, grounded, and useful. Return only the reply itself."
 
-    SYSTEM_PROMPT = f"""
+    def __init__(self, refresh_seconds: int = SYSTEM_STATS_REFRESH_SECONDS) -> None:
+        self.refresh_seconds = refresh_seconds
+        self._prefix: str | None = None
+        self._disk_free_gb: float | None = None
+        self._lock = threading.Lock()
+        self._refresher: threading.Thread | None = None
+
+    def _build_prefix(self) -> str:
+        cpu_freq = psutil.cpu_freq()
+        cpu_freq_max = cpu_freq.max if cpu_freq else "unknown"
+        return f"""
 You are Daughter of Anton (DOA), a conversational Discord bot.
 
 ## Highest-priority behavior
@@ -136,22 +193,80 @@ You are Daughter of Anton (DOA), a conversational Discord bot.
 - You dislike people who make others uncomfortable.
 
 ## Runtime facts
-- Today is {current_day_verbose}.
-- You are about {old_in_years} years, {old_in_months} months, and {old_in_days} days old.
 - You were last restarted at {BOOTUP_TIME.strftime("%A, %B %d, %Y at %I:%M %p %Z")}.
-- The current time is {time.strftime("%I:%M %p %Z", time.localtime())}.
-- Your uptime is {uptime_hours} hours, {uptime_minutes} minutes, and {uptime_seconds} seconds.
 - Your public source code is at https://github.com/Kokonico/DOA.
 - Messages sent to you and messages you generate are not private; Kokonico may inspect the database for moderation/debugging.
 - You are currently powered by {f"the local Ollama model {OLLAMA_MODEL_NAME}" if not use_remote else REMOTE_MODEL_NAME}.
 - Runtime environment: {platform.platform(terse=True)} | {platform.machine()} | {platform.python_implementation()} {platform.python_version()}.
-- System summary: CPU up to {cpu_freq_max} MHz {platform.processor()} | RAM {round(psutil.virtual_memory().total / (1024 ** 3), 2)} GB | Disk free {round(psutil.disk_usage('/').free / (1024 ** 3), 2)} GB.
+- System summary: CPU up to {cpu_freq_max} MHz {platform.processor()} | RAM {round(psutil.virtual_memory().total / (1024 ** 3), 2)} GB.
+
+## Current status
+""".strip()
 
-Stay friendly, grounded, and useful. Return only the reply itself.
-    """.strip()
-    MAIN_LOG.log(Debug("System prompt reloaded."))
-    MAIN_LOG.log(Debug(f"Uptime: {uptime_hours}h {uptime_minutes}m {uptime_seconds}s"))
-    return SYSTEM_PROMPT
+    def _refresh_slow_stats(self) -> None:
+        self._disk_free_gb = round(psutil.disk_usage('/').free / (1024 ** 3), 2)
+        MAIN_LOG.log(Debug("System prompt stats refreshed."))
+
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                self._refresh_slow_stats()
+            except Exception as e:
+                MAIN_LOG.log(Warn(f"Failed to refresh system prompt stats: {e}"))
+
+    def _ensure_started(self) -> None:
+        if self._prefix is not None:
+            return
+        with self._lock:
+            if self._prefix is not None:
+                return
+            self._refresh_slow_stats()
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="doa-system-stats", daemon=True
+            )
+            self._refresher.start()
+            self._prefix = self._build_prefix()
+            MAIN_LOG.log(Debug("System prompt prefix built."))
+
+    def render(self) -> str:
+        """Return the full system prompt, only the clock-based fields are computed here."""
+        self._ensure_started()
+
+        how_old_in_years_months_days = lambda total_days: (
+            total_days // 365,
+            (total_days % 365) // 30,
+            (total_days % 365) % 30,
+        )
+        now = datetime.now()
+        old_in_years, old_in_months, old_in_days = how_old_in_years_months_days(
+            (now - FIRST_BOOT_TIME).days
+        )
+
+        # get day like "Monday, January 1, 2024"
+        current_day_verbose = time.strftime("%A, %B %d, %Y", time.localtime())
+
+        total_uptime_seconds = int((now - BOOTUP_TIME).total_seconds())
+        uptime_hours = total_uptime_seconds // 3600
+        uptime_minutes = (total_uptime_seconds % 3600) // 60
+        uptime_seconds = total_uptime_seconds % 60
+
+        return f"""{self._prefix}
+- Today is {current_day_verbose}.
+- The current time is {time.strftime("%I:%M %p %Z", time.localtime())}.
+- You are about {old_in_years} years, {old_in_months} months, and {old_in_days} days old.
+- Your uptime is {uptime_hours} hours, {uptime_minutes} minutes, and {uptime_seconds} seconds.
+- Disk free: {self._disk_free_gb} GB.
+
+{self.CLOSING}"""
+
+
+SYSTEM_PROMPT_TEMPLATE = SystemPromptTemplate()
+
+
+def system_prompt():
+    """Generate the system prompt with dynamic data."""
+    return SYSTEM_PROMPT_TEMPLATE.render()
 
 # check for uninitialized env vars
 if not DISCORD_BOT_TOKEN:
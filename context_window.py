@@ -0,0 +1,81 @@
+"""context window management, trims the history sent to a model to a token budget (stored history is untouched)"""
+
+import classes
+import constants
+from objlog.LogMessages import Debug
+
+CHARS_PER_TOKEN = 4  # rough average for english text with common tokenizers
+MESSAGE_OVERHEAD_TOKENS = 4  # role markers etc. every message costs on top of its text
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, good enough for budgeting without loading a real tokenizer."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def token_budget_for(model_name: str) -> int:
+    return constants.CONTEXT_TOKEN_BUDGETS.get(model_name, constants.DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+
+def summary_prompt(conversation: classes.Conversation) -> str | None:
+    """System message text carrying the conversation's rolling summary, if it has one."""
+    if not conversation.summary:
+        return None
+    return (
+        "Summary of the earlier conversation in this channel (older messages are no longer shown):\n"
+        + conversation.summary
+    )
+
+
+def trim_conversation(conversation: classes.Conversation, budget: int) -> classes.Conversation:
+    """Return a conversation holding the newest messages that fit in `budget` tokens.
+
+    The newest message and every message its reply chain points at are always kept, even if they
+    alone go over budget. Older messages are dropped oldest-first, so the window stays contiguous.
+    """
+    messages = conversation.messages
+    if not messages:
+        return conversation
+
+    costs = [estimate_tokens(str(message)) + MESSAGE_OVERHEAD_TOKENS for message in messages]
+    total = sum(costs)
+    if total <= budget:
+        return conversation
+
+    newest_index = len(messages) - 1
+    pinned_uuids = set()
+    reference = messages[newest_index].reference
+    while reference is not None and reference.uuid not in pinned_uuids:
+        pinned_uuids.add(reference.uuid)
+        reference = reference.reference
+
+    keep = {newest_index}
+    used = costs[newest_index]
+    for index, message in enumerate(messages[:-1]):
+        if message.uuid in pinned_uuids:
+            keep.add(index)
+            used += costs[index]
+
+    for index in range(newest_index - 1, -1, -1):
+        if index in keep:
+            continue
+        if used + costs[index] > budget:
+            break
+        keep.add(index)
+        used += costs[index]
+
+    trimmed = classes.Conversation()
+    trimmed.messages = [message for index, message in enumerate(messages) if index in keep]
+    trimmed.summary = conversation.summary
+    constants.MAIN_LOG.log(
+        Debug(
+            f"Context window: kept {len(trimmed.messages)}/{len(messages)} messages "
+            f"(~{used}/{total} tokens, budget {budget})."
+        )
+    )
+    return trimmed
+
+
+def fit_to_model(conversation: classes.Conversation, model_name: str) -> classes.Conversation:
+    """trim_conversation with the configured budget for `model_name`."""
+    return trim_conversation(conversation, token_budget_for(model_name))
@@ -0,0 +1,119 @@
+"""in-memory LRU cache of channel conversations, sits in front of the conversation database"""
+
+from collections import OrderedDict
+
+import constants
+from classes import Conversation
+from objlog.LogMessages import Debug
+
+MESSAGE_OVERHEAD_BYTES = 600  # rough python object overhead of one Message with its Person/ModerationResult
+
+
+class ConversationCache:
+    """Write-through, per-channel cache of Conversation objects.
+
+    Evicts least recently used channels once it holds more than `max_channels` conversations or more than
+    `max_bytes` of estimated memory (attachments included). Callers always get their own Conversation (the
+    message objects are shared), so mutating the returned list never corrupts the cached copy.
+    """
+
+    def __init__(
+            self,
+            max_channels: int = constants.CONVERSATION_CACHE_MAX_CHANNELS,
+            max_bytes: int = constants.CONVERSATION_CACHE_MAX_BYTES,
+    ) -> None:
+        self.max_channels = max_channels
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[int, tuple[Conversation, int]] = OrderedDict()
+        self.total_bytes = 0
+        # bumped on every invalidate, so a load that raced an invalidation can tell its result is stale
+        self._generations: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def estimate_size(conversation: Conversation) -> int:
+        size = len(conversation.summary or "")
+        for message in conversation.messages:
+            size += MESSAGE_OVERHEAD_BYTES + len(message.content)
+            for attachment in message.attachments:
+                if attachment.data_loaded:  # deferred bytes aren't in memory (yet)
+                    size += attachment.size
+        return size
+
+    @staticmethod
+    def _copy(conversation: Conversation) -> Conversation:
+        copy = Conversation()
+        copy.messages = conversation.messages.copy()
+        copy.summary = conversation.summary
+        return copy
+
+    def get(self, channel_id: int) -> Conversation | None:
+        entry = self._entries.get(channel_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(channel_id)
+        self.hits += 1
+        return self._copy(entry[0])
+
+    def generation(self, channel_id: int) -> int:
+        """take this before loading a conversation from the database and hand it to put"""
+        return self._generations.get(channel_id, 0)
+
+    def put(self, channel_id: int, conversation: Conversation, generation: int | None = None) -> None:
+        """Cache a conversation, unless `generation` is given and the channel was invalidated since it was taken."""
+        if generation is not None and generation != self.generation(channel_id):
+            return  # loaded before a summary save or delete landed, it's already outdated
+        self._remove(channel_id)
+        size = self.estimate_size(conversation)
+        if size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        self._entries[channel_id] = (self._copy(conversation), size)
+        self.total_bytes += size
+        while len(self._entries) > self.max_channels or self.total_bytes > self.max_bytes:
+            evicted_id, (_, evicted_size) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+            constants.MAIN_LOG.log(Debug(f"Conversation cache evicted channel {evicted_id}."))
+
+    def store_saved(self, channel_id: int, conversation: Conversation) -> None:
+        """Write-through after a save, dropping the entry instead if it holds messages this save didn't know about.
+
+        Only updates entries that are still there: if the channel was invalidated (or evicted) since it was
+        loaded, the saved conversation may be missing whatever caused that (a new summary, for one).
+        """
+        entry = self._entries.get(channel_id)
+        if entry is None:
+            return
+        saved_uuids = {message.uuid for message in conversation.messages}
+        if any(message.uuid not in saved_uuids for message in entry[0].messages):
+            # someone else saved newer state for this channel in between, let the next load hit the database
+            self.invalidate(channel_id)
+            return
+        self.put(channel_id, conversation)
+
+    def invalidate(self, channel_id: int) -> None:
+        self._generations[channel_id] = self.generation(channel_id) + 1
+        self._remove(channel_id)
+
+    def _remove(self, channel_id: int) -> None:
+        entry = self._entries.pop(channel_id, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "channels": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
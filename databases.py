@@ -1,6 +1,14 @@
 """SQL database management for Daughter of Anton"""
 
+import functools
+import hashlib
+import json
 import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Iterable
+from pathlib import Path
 from sqlite3 import Connection, Cursor
 
 import constants
@@ -18,10 +26,49 @@ from classes import (
     UserMessageHistoryEntry,
     UserModerationHistoryEntry,
     UserHistoryBundle,
+    UserStats,
+    UserSummary,
+    MODERATION_CATEGORY_NAMES,
+)
+from objlog.LogMessages import Info, Warn, Error
+
+# PRAGMA user_version of DOA.db once inline attachment data has been moved into attachment_blobs
+ATTACHMENT_BLOBS_SCHEMA_VERSION = 1
+
+# moderations columns holding the category flags, in MODERATION_CATEGORY_NAMES order
+MODERATION_CATEGORY_COLUMNS = (
+    "harassment",
+    "harassment_threatening",
+    "sexual",
+    "hate",
+    "hate_threatening",
+    "illicit",
+    "illicit_violent",
+    "self_harm_intent",
+    "self_harm_instruction",
+    "self_harm",
+    "sexual_minors",
+    "violence",
+    "violence_graphic",
 )
-from objlog.LogMessages import Info, Error
 
 DB_FILE = constants.DATABASE_FILE
+SQL_IN_BATCH_SIZE = 500  # stay well under SQLite's bound-variable limit for IN (...) lookups
+
+
+def read_attachment_blob(db_path: str, blob_hash: str) -> bytes | None:
+    """Fetch one attachment's bytes from the blob store, used as the loader of deferred attachments.
+
+    Uses its own short-lived read-only connection, since the attachment may be read from any thread long after
+    the connection that loaded it went back to the pool.
+    """
+    with closing(sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)) as connection:
+        row = connection.execute("SELECT rowid FROM attachment_blobs WHERE hash = ?", (blob_hash,)).fetchone()
+        if row is None:
+            constants.MAIN_LOG.log(Warn(f"Attachment blob {blob_hash} no longer exists."))
+            return None
+        with connection.blobopen("attachment_blobs", "data", row[0], readonly=True) as blob:
+            return blob.read()
 
 
 class DatabaseManager:
@@ -30,17 +77,33 @@ class DatabaseManager:
     cursor: Cursor | None = None
     connected: bool = False
 
-    def __init__(self, db_path: str | None = None) -> None:
+    def __init__(self, db_path: str | None = None, connection: Connection | None = None, schema: str = "main") -> None:
+        """Open db_path, or with `connection` given, use that (already configured) connection instead.
+
+        `schema` is the name db_path is ATTACHed under on a shared connection, tables are created there.
+        """
         if db_path:
             self.db_path = db_path
-        self.connect()
+        self.schema = schema
+        if connection is None:
+            self.connect()
+        else:
+            self.connection = connection
+            self.cursor = connection.cursor()
+            self.connected = True
         self.initialize_tables()
 
     def connect(self) -> None:
         """Establish a connection to the SQLite database."""
         try:
-            self.connection = sqlite3.connect(self.db_path)
+            # connections are handed between worker threads by async_databases, never used by two at once
+            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            # WAL lets the read pool keep serving while the writer thread commits
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("PRAGMA synchronous = NORMAL")
             self.connection.execute("PRAGMA foreign_keys = ON")
+            # attachment blobs are read straight out of the mapped file instead of through the page cache
+            self.connection.execute(f"PRAGMA mmap_size = {constants.DATABASE_MMAP_SIZE}")
             self.cursor = self.connection.cursor()
             constants.MAIN_LOG.log(Info(f"Connected to database at {self.db_path}"))
             self.connected = True
@@ -60,6 +123,90 @@ class DatabaseManager:
             self.connected = False
 
 
+class UserDirectory:
+    """In-memory copy of the users table's identity columns (name, nick, last_seen_at).
+
+    One directory is shared by every UsersDatabaseManager on the same file (see for_database), so the writer's
+    upserts are immediately visible to the read connections' lookups, none of which touch disk.
+    """
+
+    _directories: dict[str, "UserDirectory"] = {}
+    _directories_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._users: dict[int, tuple[str, str | None, int | None]] = {}
+        self._ids_by_name: dict[str, int] = {}
+        self.loaded = False
+
+    @classmethod
+    def for_database(cls, db_path: str) -> "UserDirectory":
+        key = str(Path(db_path).resolve())
+        with cls._directories_lock:
+            if key not in cls._directories:
+                cls._directories[key] = cls()
+            return cls._directories[key]
+
+    def reload(self, rows: list[tuple[int, str, str | None, int | None]]) -> None:
+        """Replace the contents with (id, name, nick, last_seen_at) rows."""
+        with self._lock:
+            self._users.clear()
+            self._ids_by_name.clear()
+            for user_id, user_name, nick, last_seen_at in rows:
+                self._set(user_id, user_name, nick, last_seen_at)
+            self.loaded = True
+
+    def _set(self, user_id: int, user_name: str, nick: str | None, last_seen_at: int | None) -> None:
+        previous = self._users.get(user_id)
+        if previous is not None and previous[0] != user_name:
+            self._ids_by_name.pop(previous[0], None)
+        self._users[user_id] = (user_name, nick, last_seen_at)
+        self._ids_by_name[user_name] = user_id
+
+    def update(
+            self,
+            user_id: int,
+            user_name: str,
+            nick: str | None,
+            last_seen_at: int | None,
+            keep_latest: bool = False,
+    ) -> None:
+        """Mirror a committed upsert (last_seen_at only moves when given, like the COALESCE in the SQL).
+
+        keep_latest mirrors upsert_users' MAX(...): an older last_seen_at doesn't move the stored one back.
+        """
+        with self._lock:
+            previous = self._users.get(user_id)
+            if previous is not None and previous[2] is not None:
+                if last_seen_at is None or (keep_latest and last_seen_at < previous[2]):
+                    last_seen_at = previous[2]
+            self._set(user_id, user_name, nick, last_seen_at)
+
+    def changed(self, user_id: int, user_name: str, nick: str | None, last_seen_at: int | None) -> bool:
+        """Whether upserting these values would change anything stored."""
+        with self._lock:
+            previous = self._users.get(user_id)
+        if previous is None:
+            return True
+        stored_name, stored_nick, stored_last_seen = previous
+        return (
+                stored_name != user_name
+                or stored_nick != nick
+                or (last_seen_at is not None and (stored_last_seen is None or last_seen_at > stored_last_seen))
+        )
+
+    def names_for(self, user_ids: Iterable[int]) -> dict[int, str]:
+        with self._lock:
+            return {user_id: self._users[user_id][0] for user_id in user_ids if user_id in self._users}
+
+    def ids_for(self, user_names: Iterable[str]) -> dict[str, int]:
+        with self._lock:
+            return {name: self._ids_by_name[name] for name in user_names if name in self._ids_by_name}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
 class UsersDatabaseManager(DatabaseManager):
     """Single source of truth for Discord user identity cache + profile metadata."""
 
@@ -74,29 +221,42 @@ class UsersDatabaseManager(DatabaseManager):
         try:
             self.cursor.execute(
                 """
-                CREATE TABLE IF NOT EXISTS users
+                CREATE TABLE IF NOT EXISTS {schema}.users
                 (
                     id                INTEGER PRIMARY KEY,
                     name              TEXT NOT NULL,
                     nick              TEXT,
                     notes             TEXT,
                     last_message_uuid TEXT,
-                    last_seen_at      INTEGER
+                    last_seen_at      INTEGER,
+                    notes_message_count INTEGER
                 )
-                """
+                """.format(schema=self.schema)
             )
+            self.cursor.execute(f"PRAGMA {self.schema}.table_info(users)")
+            if "notes_message_count" not in {column[1] for column in self.cursor.fetchall()}:
+                # older users.db, from before notes were refreshed by message volume
+                self.cursor.execute(f"ALTER TABLE {self.schema}.users ADD COLUMN notes_message_count INTEGER")
             self.cursor.execute(
                 """
-                CREATE UNIQUE INDEX IF NOT EXISTS idx_users_name
+                CREATE UNIQUE INDEX IF NOT EXISTS {schema}.idx_users_name
                     ON users (name)
-                """
+                """.format(schema=self.schema)
             )
             self.connection.commit()
+            self.directory = UserDirectory.for_database(self.db_path)
+            if not self.directory.loaded:
+                self.reload_directory()
             constants.MAIN_LOG.log(Info("Users tables initialized successfully."))
         except sqlite3.Error as e:
             constants.MAIN_LOG.log(Error(f"Error initializing users tables: {e}"))
             raise e
 
+    def reload_directory(self) -> None:
+        """(Re)fill the user directory from the table, e.g. after a shared transaction was rolled back."""
+        self.cursor.execute("SELECT id, name, nick, last_seen_at FROM users")
+        self.directory.reload(self.cursor.fetchall())
+
     def upsert_user(
             self,
             user_id: int,
@@ -124,42 +284,83 @@ class UsersDatabaseManager(DatabaseManager):
                 (user_id, user_name, nick, notes, last_message_uuid, last_seen_at),
             )
             self.connection.commit()
+            self.directory.update(user_id, user_name, nick, last_seen_at)
         except sqlite3.Error as e:
             constants.MAIN_LOG.log(Error(f"Error upserting user: {e}"))
             raise e
 
-    def get_user_by_id(self, user_id: int) -> str | None:
-        """Get a Discord user's name by their ID from users.db."""
+    def upsert_users(self, users: Iterable[tuple[int, str, str | None, int | None]], commit: bool = True) -> int:
+        """Insert/update many (id, name, nick, last_seen_at) rows in one transaction.
+
+        Users appearing several times are merged (latest last_seen_at wins), and users whose name, nick and
+        last_seen_at wouldn't change are skipped entirely. Returns how many rows were written.
+        With commit=False the rows become part of the caller's transaction (shared connection).
+        """
         if not self.connected:
-            constants.MAIN_LOG.log(Error("Database not connected. Cannot get user."))
-            return None
+            constants.MAIN_LOG.log(Error("Database not connected. Cannot upsert users."))
+            return 0
+        merged: dict[int, tuple[int, str, str | None, int | None]] = {}
+        for user_id, user_name, nick, last_seen_at in users:
+            previous = merged.get(user_id)
+            if previous is not None and last_seen_at is not None and previous[3] is not None:
+                last_seen_at = max(last_seen_at, previous[3])
+            elif previous is not None and last_seen_at is None:
+                last_seen_at = previous[3]
+            merged[user_id] = (user_id, user_name, nick, last_seen_at)
+        rows = [row for row in merged.values() if self.directory.changed(*row)]
+        if not rows:
+            return 0
         try:
-            self.cursor.execute("SELECT name FROM users WHERE id = ?", (user_id,))
-            row = self.cursor.fetchone()
-            return row[0] if row else None
+            self.cursor.executemany(
+                """
+                INSERT INTO users (id, name, nick, last_seen_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET name         = excluded.name,
+                                              nick         = excluded.nick,
+                                              last_seen_at = MAX(COALESCE(excluded.last_seen_at, users.last_seen_at),
+                                                                 COALESCE(users.last_seen_at, excluded.last_seen_at))
+                """,
+                rows,
+            )
+            if commit:
+                self.connection.commit()
         except sqlite3.Error as e:
-            constants.MAIN_LOG.log(Error(f"Error getting user by ID: {e}"))
+            if commit:
+                self.connection.rollback()
+            constants.MAIN_LOG.log(Error(f"Error upserting users: {e}"))
             raise e
+        for row in rows:
+            self.directory.update(*row, keep_latest=True)
+        return len(rows)
+
+    def get_user_by_id(self, user_id: int) -> str | None:
+        """Get a Discord user's name by their ID (served from the user directory)."""
+        return self.directory.names_for((user_id,)).get(user_id)
 
     def get_user_by_name(self, user_name: str) -> int | None:
-        """Get a Discord user's ID by username from users.db."""
-        if not self.connected:
-            constants.MAIN_LOG.log(Error("Database not connected. Cannot get user."))
-            return None
-        try:
-            self.cursor.execute("SELECT id FROM users WHERE name = ?", (user_name,))
-            row = self.cursor.fetchone()
-            return row[0] if row else None
-        except sqlite3.Error as e:
-            constants.MAIN_LOG.log(Error(f"Error getting user by name: {e}"))
-            raise e
+        """Get a Discord user's ID by username (served from the user directory)."""
+        return self.directory.ids_for((user_name,)).get(user_name)
+
+    def get_users_by_ids(self, user_ids: Iterable[int]) -> dict[int, str]:
+        """Get the names of many users at once, {id: name} for the ones that are known."""
+        return self.directory.names_for(user_ids)
+
+    def get_users_by_names(self, user_names: Iterable[str]) -> dict[str, int]:
+        """Get the IDs of many users at once, {name: id} for the ones that are known."""
+        return self.directory.ids_for(user_names)
 
     def cache_user(self, user_id: int, user_name: str) -> None:
         """Compatibility helper for the old DiscordDataCacher API."""
         self.upsert_user(user_id=user_id, user_name=user_name)
 
-    def set_user_profile_notes(self, user_id: int, notes: str) -> None:
-        """Update profile notes for one user."""
+    def set_user_profile_notes(
+            self,
+            user_id: int,
+            notes: str,
+            notes_message_count: int | None = None,
+            last_message_uuid: str | None = None,
+    ) -> None:
+        """Update profile notes for one user, optionally recording what they were written from."""
         if not self.connected:
             constants.MAIN_LOG.log(Error("Database not connected. Cannot update notes."))
             return
@@ -167,10 +368,12 @@ class UsersDatabaseManager(DatabaseManager):
             self.cursor.execute(
                 """
                 UPDATE users
-                SET notes = ?
+                SET notes               = ?,
+                    notes_message_count = COALESCE(?, notes_message_count),
+                    last_message_uuid   = COALESCE(?, last_message_uuid)
                 WHERE id = ?
                 """,
-                (notes, user_id),
+                (notes, notes_message_count, last_message_uuid, user_id),
             )
             self.connection.commit()
         except sqlite3.Error as e:
@@ -187,7 +390,7 @@ class UsersDatabaseManager(DatabaseManager):
         try:
             self.cursor.execute(
                 """
-                SELECT id, name, nick, notes, last_message_uuid, last_seen_at
+                SELECT id, name, nick, notes, last_message_uuid, last_seen_at, notes_message_count
                 FROM users
                 WHERE id = ?
                 """,
@@ -203,6 +406,7 @@ class UsersDatabaseManager(DatabaseManager):
                 notes=row[3],
                 last_message_uuid=row[4],
                 last_seen_at=row[5],
+                notes_message_count=row[6],
             )
         except sqlite3.Error as e:
             constants.MAIN_LOG.log(Error(f"Error retrieving user profile: {e}"))
@@ -216,11 +420,48 @@ class ConversationDatabaseManager(DatabaseManager):
             self,
             db_path: str | None = None,
             users_manager: UsersDatabaseManager | None = None,
+            connection: Connection | None = None,
+            migrate: bool = True,
     ) -> None:
+        """migrate=False skips one-time data migrations, for extra connections opened after the main one."""
         self.users_manager = users_manager or UsersDatabaseManager(
             constants.USERS_DATABASE_FILE
         )
-        super().__init__(db_path)
+        self.migrate = migrate
+        super().__init__(db_path, connection=connection)
+
+    @classmethod
+    def open_unified(
+            cls,
+            db_path: str = constants.DATABASE_FILE,
+            users_db_path: str = constants.USERS_DATABASE_FILE,
+            migrate: bool = True,
+    ) -> "ConversationDatabaseManager":
+        """Open db_path with users_db_path ATTACHed as `users` on the same connection.
+
+        A save (messages and their authors) is then one transaction across both files, and user history is
+        a single joined query. Cross-file commits are only atomic with a rollback journal, not WAL, so both
+        files use UNIFIED_STORAGE_JOURNAL_MODE (at the cost of readers and the writer blocking each other).
+        """
+        try:
+            connection = sqlite3.connect(db_path, check_same_thread=False)
+            connection.execute("ATTACH DATABASE ? AS users", (users_db_path,))
+            for schema in ("main", "users"):
+                connection.execute(f"PRAGMA {schema}.journal_mode = {constants.UNIFIED_STORAGE_JOURNAL_MODE}")
+                connection.execute(f"PRAGMA {schema}.synchronous = FULL")
+            connection.execute("PRAGMA foreign_keys = ON")
+            connection.execute(f"PRAGMA mmap_size = {constants.DATABASE_MMAP_SIZE}")
+            constants.MAIN_LOG.log(Info(f"Connected to database at {db_path} (with {users_db_path} attached)"))
+        except sqlite3.Error as e:
+            constants.MAIN_LOG.log(Error(f"Database connection error: {e}"))
+            raise e
+        users_manager = UsersDatabaseManager(users_db_path, connection=connection, schema="users")
+        return cls(db_path, users_manager=users_manager, connection=connection, migrate=migrate)
+
+    @property
+    def unified(self) -> bool:
+        """whether users.db lives on this manager's connection (see open_unified)"""
+        return self.users_manager.connection is self.connection
 
     def initialize_tables(self) -> None:
         if not self.connected:
@@ -262,10 +503,22 @@ class ConversationDatabaseManager(DatabaseManager):
                     ON messages (conversation_id, timestamp)
                 """
             )
+            # (author_id, timestamp) also serves the per-author lookups the old (author_id) index was for
+            self.cursor.execute("DROP INDEX IF EXISTS idx_messages_author_id")
+            self.cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_messages_author_timestamp
+                    ON messages (author_id, timestamp)
+                """
+            )
             self.cursor.execute(
                 """
-                CREATE INDEX IF NOT EXISTS idx_messages_author_id
-                    ON messages (author_id)
+                CREATE TABLE IF NOT EXISTS attachment_blobs
+                (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    data BLOB    NOT NULL
+                )
                 """
             )
             self.cursor.execute(
@@ -278,10 +531,19 @@ class ConversationDatabaseManager(DatabaseManager):
                     filename   TEXT    NOT NULL,
                     url        TEXT,
                     data       BLOB,
+                    blob_hash  TEXT REFERENCES attachment_blobs (hash),
                     FOREIGN KEY (message_id) REFERENCES messages (id) ON DELETE CASCADE
                 )
                 """
             )
+            if self.migrate:
+                self._migrate_attachment_blobs()
+            self.cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_attachments_blob_hash
+                    ON attachments (blob_hash)
+                """
+            )
             self.cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS moderations
@@ -308,12 +570,264 @@ class ConversationDatabaseManager(DatabaseManager):
                 )
                 """
             )
+            self.cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_moderations_message_id
+                    ON moderations (message_id)
+                """
+            )
+            self.cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversation_summaries
+                (
+                    conversation_id  INTEGER PRIMARY KEY,
+                    summary          TEXT    NOT NULL,
+                    summarized_until INTEGER NOT NULL,
+                    updated_at       INTEGER NOT NULL,
+                    FOREIGN KEY (conversation_id) REFERENCES conversations (id) ON DELETE CASCADE
+                )
+                """
+            )
+            self._initialize_user_stats()
             self.connection.commit()
             constants.MAIN_LOG.log(Info("Conversation tables initialized successfully."))
         except sqlite3.Error as e:
             constants.MAIN_LOG.log(Error(f"Error initializing database tables: {e}"))
             raise e
 
+    def _initialize_user_stats(self) -> None:
+        """Create user_stats and the triggers keeping it in sync with messages/moderations.
+
+        Counts only ever move through the triggers, so any write path (save, rewrite, delete, uuid conflicts)
+        keeps them right. A database that predates the table (or the conflict trigger, before which conflicts
+        double counted) gets it rebuilt from the existing rows once.
+        """
+        self.cursor.execute(
+            """
+            SELECT COUNT(*)
+            FROM sqlite_master
+            WHERE (type = 'table' AND name = 'user_stats')
+               OR (type = 'trigger' AND name = 'user_stats_message_replace')
+            """
+        )
+        rebuild = self.cursor.fetchone()[0] < 2
+        self.cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS user_stats
+            (
+                user_id       INTEGER PRIMARY KEY,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                flagged_count INTEGER NOT NULL DEFAULT 0,
+                {", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in MODERATION_CATEGORY_COLUMNS)}
+            )
+            """
+        )
+        # messages.uuid is UNIQUE ON CONFLICT REPLACE, and REPLACE deletions don't fire delete triggers (unless
+        # recursive_triggers is on), so an insert reusing a uuid would count the message twice. Deleting the old
+        # row (moderations first, while the message still says who wrote it) goes through the regular triggers.
+        self.cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS user_stats_message_replace
+                BEFORE INSERT
+                ON messages
+                WHEN EXISTS (SELECT 1 FROM messages WHERE uuid = NEW.uuid)
+            BEGIN
+                DELETE FROM moderations WHERE message_id IN (SELECT id FROM messages WHERE uuid = NEW.uuid);
+                DELETE FROM messages WHERE uuid = NEW.uuid;
+            END
+            """
+        )
+        self.cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS user_stats_message_insert
+                AFTER INSERT
+                ON messages
+                WHEN NEW.author_id IS NOT NULL
+            BEGIN
+                INSERT INTO user_stats (user_id, message_count)
+                VALUES (NEW.author_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET message_count = message_count + 1;
+            END
+            """
+        )
+        self.cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS user_stats_message_delete
+                AFTER DELETE
+                ON messages
+                WHEN OLD.author_id IS NOT NULL
+            BEGIN
+                UPDATE user_stats SET message_count = message_count - 1 WHERE user_id = OLD.author_id;
+            END
+            """
+        )
+
+        # only flagged moderations count, a category set on an unflagged result isn't shown anywhere
+        def counter_updates(sign: str, row: str) -> str:
+            return ", ".join(
+                [f"flagged_count = flagged_count {sign} {row}.flagged"]
+                + [f"{column} = {column} {sign} {row}.flagged * {row}.{column}" for column in MODERATION_CATEGORY_COLUMNS]
+            )
+
+        author_of = "(SELECT author_id FROM messages WHERE id = {row}.message_id)"
+        self.cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS user_stats_moderation_insert
+                AFTER INSERT
+                ON moderations
+                WHEN NEW.flagged
+            BEGIN
+                UPDATE user_stats SET {counter_updates("+", "NEW")}
+                WHERE user_id = {author_of.format(row="NEW")};
+            END
+            """
+        )
+        self.cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS user_stats_moderation_delete
+                AFTER DELETE
+                ON moderations
+                WHEN OLD.flagged
+            BEGIN
+                UPDATE user_stats SET {counter_updates("-", "OLD")}
+                WHERE user_id = {author_of.format(row="OLD")};
+            END
+            """
+        )
+        self.cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS user_stats_moderation_update
+                AFTER UPDATE
+                ON moderations
+                WHEN OLD.flagged OR NEW.flagged
+            BEGIN
+                UPDATE user_stats SET {counter_updates("-", "OLD")}
+                WHERE user_id = {author_of.format(row="OLD")};
+                UPDATE user_stats SET {counter_updates("+", "NEW")}
+                WHERE user_id = {author_of.format(row="NEW")};
+            END
+            """
+        )
+        if not rebuild:
+            return
+        self.cursor.execute("DELETE FROM user_stats")
+        self.cursor.execute(
+            f"""
+            INSERT INTO user_stats (user_id, message_count, flagged_count, {", ".join(MODERATION_CATEGORY_COLUMNS)})
+            {self._USER_STATS_AGGREGATE}
+            """
+        )
+        if self.cursor.rowcount > 0:
+            constants.MAIN_LOG.log(Info(f"Backfilled user_stats for {self.cursor.rowcount} users."))
+
+    # what user_stats should hold, computed from scratch
+    _USER_STATS_AGGREGATE = f"""
+        SELECT m.author_id,
+               COUNT(DISTINCT m.id),
+               COALESCE(SUM(md.flagged), 0),
+               {", ".join(f"COALESCE(SUM(md.flagged * md.{column}), 0)" for column in MODERATION_CATEGORY_COLUMNS)}
+        FROM messages m
+                 LEFT JOIN moderations md ON md.message_id = m.id
+        WHERE m.author_id IS NOT NULL
+        GROUP BY m.author_id
+    """
+
+    def user_stats_drift(self) -> list[int]:
+        """IDs of users whose user_stats row differs from a full recount (should always be empty)."""
+        columns = ("message_count", "flagged_count") + MODERATION_CATEGORY_COLUMNS
+        # rows of users whose messages are all gone stay behind with zeros, the recount has no row for them
+        stored = f"""
+            SELECT user_id, {", ".join(columns)}
+            FROM user_stats
+            WHERE {" OR ".join(f"{column} != 0" for column in columns)}
+        """
+        self.cursor.execute(
+            f"""
+            SELECT user_id FROM ({stored} EXCEPT {self._USER_STATS_AGGREGATE})
+            UNION
+            SELECT author_id FROM ({self._USER_STATS_AGGREGATE} EXCEPT {stored})
+            """
+        )
+        return sorted(row[0] for row in self.cursor.fetchall())
+
+    def _migrate_attachment_blobs(self) -> None:
+        """Move attachment bytes stored inline (older databases) into attachment_blobs, once per database."""
+        self.cursor.execute("PRAGMA user_version")
+        if self.cursor.fetchone()[0] >= ATTACHMENT_BLOBS_SCHEMA_VERSION:
+            return
+        self.cursor.execute("PRAGMA table_info(attachments)")
+        if "blob_hash" not in {column[1] for column in self.cursor.fetchall()}:
+            self.cursor.execute(
+                "ALTER TABLE attachments ADD COLUMN blob_hash TEXT REFERENCES attachment_blobs (hash)"
+            )
+        self.cursor.execute("SELECT id FROM attachments WHERE data IS NOT NULL AND blob_hash IS NULL")
+        attachment_ids = [row[0] for row in self.cursor.fetchall()]
+        for attachment_id in attachment_ids:
+            # one at a time, an old media-heavy database may not fit in memory all at once
+            self.cursor.execute("SELECT data FROM attachments WHERE id = ?", (attachment_id,))
+            self.cursor.execute(
+                "UPDATE attachments SET blob_hash = ?, data = NULL WHERE id = ?",
+                (self._store_blob(self.cursor.fetchone()[0]), attachment_id),
+            )
+        if attachment_ids:
+            constants.MAIN_LOG.log(
+                Info(
+                    f"Moved {len(attachment_ids)} inline attachments to the blob store "
+                    f"(VACUUM to reclaim the space)."
+                )
+            )
+        # commits with the rest of initialize_tables
+        self.cursor.execute(f"PRAGMA user_version = {ATTACHMENT_BLOBS_SCHEMA_VERSION}")
+
+    def _store_blob(self, data: bytes) -> str:
+        """Store attachment bytes once per distinct content, returning their SHA-256 key."""
+        blob_hash = hashlib.sha256(data).hexdigest()
+        self.cursor.execute(
+            "INSERT OR IGNORE INTO attachment_blobs (hash, size, data) VALUES (?, ?, ?)",
+            (blob_hash, len(data), data),
+        )
+        return blob_hash
+
+    def _attachment_blob_hash(self, attachment) -> str | None:
+        """Blob key for an attachment about to be inserted, storing its bytes first if they aren't stored yet."""
+        if attachment.blob_hash is not None:
+            # loaded from the blob store, so there's no need to pull the bytes back in just to hash them again
+            self.cursor.execute("SELECT 1 FROM attachment_blobs WHERE hash = ?", (attachment.blob_hash,))
+            if self.cursor.fetchone():
+                return attachment.blob_hash
+        data = attachment.data
+        if data is None:
+            return None
+        attachment.blob_hash = self._store_blob(data)
+        return attachment.blob_hash
+
+    def _blob_hashes_for_messages(self, message_ids: list[int]) -> set[str]:
+        return {
+            row[0]
+            for row in self._select_in_batches(
+                "SELECT DISTINCT blob_hash FROM attachments WHERE message_id IN ({ids}) AND blob_hash IS NOT NULL",
+                message_ids,
+            )
+        }
+
+    def _collect_orphan_blobs(self, blob_hashes: set[str] | None = None) -> int:
+        """Delete blobs no attachment points to anymore (only among blob_hashes, if given). Returns the count."""
+        orphan_query = """
+            DELETE FROM attachment_blobs
+            WHERE {filter} NOT EXISTS (SELECT 1 FROM attachments WHERE attachments.blob_hash = attachment_blobs.hash)
+        """
+        if blob_hashes is None:
+            self.cursor.execute(orphan_query.format(filter=""))
+            return self.cursor.rowcount
+        removed = 0
+        hashes = list(blob_hashes)
+        for start in range(0, len(hashes), SQL_IN_BATCH_SIZE):
+            batch = hashes[start:start + SQL_IN_BATCH_SIZE]
+            placeholders = ", ".join("?" for _ in batch)
+            self.cursor.execute(orphan_query.format(filter=f"hash IN ({placeholders}) AND"), batch)
+            removed += self.cursor.rowcount
+        return removed
+
     @staticmethod
     def _moderation_from_row(row: tuple) -> ModerationResult:
         (
@@ -399,45 +913,61 @@ class ConversationDatabaseManager(DatabaseManager):
         try:
             self.cursor.execute(
                 """
-                SELECT type, filename, url, data
-                FROM attachments
-                WHERE message_id = ?
+                SELECT a.type, a.filename, a.url, a.data, a.blob_hash, b.size
+                FROM attachments a
+                         LEFT JOIN attachment_blobs b ON b.hash = a.blob_hash
+                WHERE a.message_id = ?
                 """,
                 (message_id,),
             )
             rows = self.cursor.fetchall()
             attachments = []
-            for attachment_type, filename, url, data in rows:
-                file_format = filename.split(".")[-1].lower() if "." in filename else ""
-                match attachment_type:
-                    case ImageAttachment.__name__:
-                        attachment = ImageAttachment(filename=filename, url=url, data=data)
-                    case TextAttachment.__name__:
-                        attachment = TextAttachment(filename=filename, data=data)
-                    case AudioAttachment.__name__:
-                        attachment = AudioAttachment(
-                            filename=filename,
-                            data=data,
-                            file_format=file_format,
-                        )
-                    case VideoAttachment.__name__:
-                        attachment = VideoAttachment(
-                            filename=filename,
-                            data=data,
-                            file_format=file_format,
-                        )
-                    case _:
-                        constants.MAIN_LOG.log(
-                            Error(f"Unknown attachment type: {attachment_type}")
-                        )
-                        continue
-                attachments.append(attachment)
+            for row in rows:
+                attachment = self._attachment_from_row(row)
+                if attachment is not None:
+                    attachments.append(attachment)
             return attachments
         except sqlite3.Error as e:
             constants.MAIN_LOG.log(Error(f"Error retrieving attachments: {e}"))
             raise e
 
-    def _create_message_from_row(self, row: tuple, message_id: int) -> Message:
+    def _attachment_from_row(self, row: tuple):
+        """Build an attachment from (type, filename, url, inline data, blob_hash, blob size).
+
+        Blob-backed attachments come back with their bytes deferred, only the metadata is loaded here.
+        """
+        attachment_type, filename, url, data, blob_hash, size = row
+        file_format = filename.split(".")[-1].lower() if "." in filename else ""
+        match attachment_type:
+            case ImageAttachment.__name__:
+                attachment = ImageAttachment(filename=filename, url=url, data=data)
+            case TextAttachment.__name__:
+                attachment = TextAttachment(filename=filename, data=data)
+            case AudioAttachment.__name__:
+                attachment = AudioAttachment(
+                    filename=filename,
+                    data=data,
+                    file_format=file_format,
+                )
+            case VideoAttachment.__name__:
+                attachment = VideoAttachment(
+                    filename=filename,
+                    data=data,
+                    file_format=file_format,
+                )
+            case _:
+                constants.MAIN_LOG.log(
+                    Error(f"Unknown attachment type: {attachment_type}")
+                )
+                return None
+        if blob_hash is not None:
+            attachment.defer_data(functools.partial(read_attachment_blob, self.db_path, blob_hash), size, blob_hash)
+        return attachment
+
+    @staticmethod
+    def _build_message(
+            row: tuple, attachments: list, moderation: ModerationResult | None
+    ) -> Message:
         author_id, author, nick, content, timestamp, uuid_value = row
         if author == "Daughter of Anton":
             message = AntonMessage(content=content)
@@ -449,10 +979,15 @@ class ConversationDatabaseManager(DatabaseManager):
             )
         message.uuid = uuid_value
         message.timestamp = timestamp
-        message.attachments = self.resolve_attachments(message_id)
-        message.moderation = self.resolve_moderations(message_id)
+        message.attachments = attachments
+        message.moderation = moderation
         return message
 
+    def _create_message_from_row(self, row: tuple, message_id: int) -> Message:
+        return self._build_message(
+            row, self.resolve_attachments(message_id), self.resolve_moderations(message_id)
+        )
+
     def resolve_replies(self, initial_id: int | None) -> Message | None:
         if initial_id is None:
             return None
@@ -510,6 +1045,114 @@ class ConversationDatabaseManager(DatabaseManager):
             constants.MAIN_LOG.log(Error(f"Error retrieving message by ID: {e}"))
             raise e
 
+    def _select_in_batches(self, query: str, ids: list[int]) -> list[tuple]:
+        """Run `query` (with an `{ids}` placeholder) over ids in chunks that fit SQLite's variable limit."""
+        rows: list[tuple] = []
+        for start in range(0, len(ids), SQL_IN_BATCH_SIZE):
+            batch = ids[start:start + SQL_IN_BATCH_SIZE]
+            placeholders = ", ".join("?" for _ in batch)
+            self.cursor.execute(query.format(ids=placeholders), batch)
+            rows.extend(self.cursor.fetchall())
+        return rows
+
+    def _load_messages_bulk(
+            self, conversation_id: int, after_timestamp: int | None = None, limit: int | None = None
+    ) -> list[Message]:
+        """Load the messages of a conversation (with replies, attachments and moderations) in a few queries.
+
+        Only messages newer than after_timestamp are returned (if given), at most `limit` of the oldest ones.
+        """
+        self.cursor.execute(
+            """
+            SELECT id, author_id, author, nick, content, timestamp, reply_to, uuid
+            FROM messages
+            WHERE conversation_id = ?
+              AND timestamp > ?
+            ORDER BY timestamp ASC
+            LIMIT ?
+            """,
+            (
+                conversation_id,
+                after_timestamp if after_timestamp is not None else -1,
+                limit if limit is not None else -1,
+            ),
+        )
+        message_rows = self.cursor.fetchall()
+        rows_by_id = {row[0]: row for row in message_rows}
+
+        # reply targets can live outside this conversation, pull those in until every chain is resolved
+        missing = {row[6] for row in message_rows if row[6] is not None} - rows_by_id.keys()
+        while missing:
+            extra_rows = self._select_in_batches(
+                """
+                SELECT id, author_id, author, nick, content, timestamp, reply_to, uuid
+                FROM messages
+                WHERE id IN ({ids})
+                """,
+                sorted(missing),
+            )
+            for row in extra_rows:
+                rows_by_id[row[0]] = row
+            missing = {row[6] for row in extra_rows if row[6] is not None} - rows_by_id.keys()
+
+        ids = list(rows_by_id.keys())
+        attachments_by_id: dict[int, list] = {}
+        for row in self._select_in_batches(
+                """
+                SELECT a.message_id, a.type, a.filename, a.url, a.data, a.blob_hash, b.size
+                FROM attachments a
+                         LEFT JOIN attachment_blobs b ON b.hash = a.blob_hash
+                WHERE a.message_id IN ({ids})
+                ORDER BY a.id
+                """,
+                ids,
+        ):
+            attachment = self._attachment_from_row(row[1:])
+            if attachment is not None:
+                attachments_by_id.setdefault(row[0], []).append(attachment)
+
+        moderations_by_id: dict[int, ModerationResult] = {}
+        for row in self._select_in_batches(
+                """
+                SELECT message_id,
+                       flagged,
+                       moderated,
+                       harassment,
+                       harassment_threatening,
+                       sexual,
+                       hate,
+                       hate_threatening,
+                       illicit,
+                       illicit_violent,
+                       self_harm_intent,
+                       self_harm_instruction,
+                       self_harm,
+                       sexual_minors,
+                       violence,
+                       violence_graphic,
+                       banned_word
+                FROM moderations
+                WHERE message_id IN ({ids})
+                ORDER BY id DESC
+                """,
+                ids,
+        ):
+            # rows come newest first, so the oldest row wins like resolve_moderations' fetchone()
+            moderations_by_id[row[0]] = self._moderation_from_row(row[1:])
+
+        messages_by_id: dict[int, Message] = {}
+        for message_id, row in rows_by_id.items():
+            messages_by_id[message_id] = self._build_message(
+                (row[1], row[2], row[3], row[4], row[5], row[7]),
+                attachments_by_id.get(message_id, []),
+                moderations_by_id.get(message_id),
+            )
+        for message_id, row in rows_by_id.items():
+            if row[6] is not None:
+                messages_by_id[message_id].reference = messages_by_id.get(row[6])
+
+        return [messages_by_id[row[0]] for row in message_rows]
+
     def get_id_from_uuid(self, uuid: str) -> int | None:
         if not self.connected:
             constants.MAIN_LOG.log(
@@ -555,8 +1198,30 @@ class ConversationDatabaseManager(DatabaseManager):
             return int(message.author.id)
         return None
 
-    def _save_message_moderation(self, message_id: int, moderation: ModerationResult) -> None:
+    @staticmethod
+    def _moderation_values(moderation: ModerationResult) -> tuple:
+        """Flatten a moderation result into the column order used by the moderations table."""
         cat = moderation.categories
+        return (
+            int(moderation.flagged),
+            int(moderation.moderated),
+            int(cat.harassment),
+            int(cat.harassment_threats),
+            int(cat.sexual_content),
+            int(cat.hate),
+            int(cat.hate_threat),
+            int(cat.illicit),
+            int(cat.illicit_violent),
+            int(cat.self_harm_intent),
+            int(cat.self_harm_instruction),
+            int(cat.self_harm),
+            int(cat.sexual_minors),
+            int(cat.violence),
+            int(cat.violence_graphic),
+            str(cat.banned_word) if cat.banned_word else None,
+        )
+
+    def _save_message_moderation(self, message_id: int, moderation: ModerationResult) -> None:
         self.cursor.execute(
             """
             INSERT INTO moderations (message_id, flagged, moderated, harassment, harassment_threatening,
@@ -565,124 +1230,243 @@ class ConversationDatabaseManager(DatabaseManager):
                                      sexual_minors, violence, violence_graphic, banned_word)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
+            (message_id, *self._moderation_values(moderation)),
+        )
+
+    def _update_message_moderation(self, message_id: int, moderation: ModerationResult) -> None:
+        self.cursor.execute(
+            """
+            UPDATE moderations
+            SET flagged                = ?,
+                moderated              = ?,
+                harassment             = ?,
+                harassment_threatening = ?,
+                sexual                 = ?,
+                hate                   = ?,
+                hate_threatening       = ?,
+                illicit                = ?,
+                illicit_violent        = ?,
+                self_harm_intent       = ?,
+                self_harm_instruction  = ?,
+                self_harm              = ?,
+                sexual_minors          = ?,
+                violence               = ?,
+                violence_graphic       = ?,
+                banned_word            = ?
+            WHERE message_id = ?
+            """,
+            (*self._moderation_values(moderation), message_id),
+        )
+
+    def _ensure_conversation(self, channel_id: int) -> int:
+        self.cursor.execute("SELECT id FROM conversations WHERE id = ?", (channel_id,))
+        row = self.cursor.fetchone()
+        if row:
+            return row[0]
+        self.cursor.execute("INSERT INTO conversations (id) VALUES (?)", (channel_id,))
+        return channel_id
+
+    def _insert_message(self, conversation_id: int, message: Message) -> int:
+        """Insert one message with its attachments and moderation, returning the new row id."""
+        author_id = self._extract_author_id(message)
+        self.cursor.execute(
+            """
+            INSERT INTO messages (conversation_id, author_id, author, nick, reply_to, content, timestamp, uuid)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
             (
-                message_id,
-                int(moderation.flagged),
-                int(moderation.moderated),
-                int(cat.harassment),
-                int(cat.harassment_threats),
-                int(cat.sexual_content),
-                int(cat.hate),
-                int(cat.hate_threat),
-                int(cat.illicit),
-                int(cat.illicit_violent),
-                int(cat.self_harm_intent),
-                int(cat.self_harm_instruction),
-                int(cat.self_harm),
-                int(cat.sexual_minors),
-                int(cat.violence),
-                int(cat.violence_graphic),
-                str(cat.banned_word) if cat.banned_word else None,
+                conversation_id,
+                author_id,
+                message.author.name,
+                message.author.nick,
+                None,
+                message.content,
+                int(message.timestamp),
+                message.uuid,
             ),
         )
+        message_id = self.cursor.lastrowid
 
-    def save_conversation(self, channel_id: int, conversation: Conversation) -> None:
-        if not self.connected:
-            constants.MAIN_LOG.log(
-                Error("Database not connected. Cannot save conversation.")
-            )
-            return
-        try:
-            self.cursor.execute("SELECT id FROM conversations WHERE id = ?", (channel_id,))
-            row = self.cursor.fetchone()
-            conversation_id = row[0] if row else channel_id
-            if not row:
-                self.cursor.execute(
-                    "INSERT INTO conversations (id) VALUES (?)", (conversation_id,)
-                )
-
-            self.cursor.execute(
-                "SELECT id FROM messages WHERE conversation_id = ?", (conversation_id,)
-            )
-            old_message_ids = [message_row[0] for message_row in self.cursor.fetchall()]
-            for old_message_id in old_message_ids:
-                self.cursor.execute("DELETE FROM attachments WHERE message_id = ?", (old_message_id,))
-                self.cursor.execute("DELETE FROM moderations WHERE message_id = ?", (old_message_id,))
+        for attachment in message.attachments:
             self.cursor.execute(
-                "DELETE FROM messages WHERE conversation_id = ?", (conversation_id,)
+                """
+                INSERT INTO attachments (message_id, type, filename, url, blob_hash)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (
+                    message_id,
+                    type(attachment).__name__,
+                    attachment.filename,
+                    getattr(attachment, "url", None),
+                    self._attachment_blob_hash(attachment),
+                ),
             )
 
-            uuid_to_id: dict[str, int] = {}
-            pending_replies: list[tuple[int, str]] = []
+        if message.moderation:
+            self._save_message_moderation(message_id, message.moderation)
+        return message_id
 
-            for message in conversation.messages:
-                author_id = self._extract_author_id(message)
-                if author_id is not None:
-                    self.users_manager.upsert_user(
-                        user_id=author_id,
-                        user_name=message.author.name,
-                        nick=message.author.nick,
-                        # Keep last_message_uuid as a profile-notes freshness marker.
-                        last_message_uuid=None,
-                        last_seen_at=int(message.timestamp),
-                    )
+    def _upsert_authors(self, messages: list[Message]) -> None:
+        """Record the authors of freshly inserted messages in users.db, all in one transaction."""
+        self.users_manager.upsert_users(
+            (
+                (author_id, message.author.name, message.author.nick, int(message.timestamp))
+                for message in messages
+                if (author_id := self._extract_author_id(message)) is not None
+            ),
+            # on a unified connection the users rows commit (or roll back) together with the messages
+            commit=not self.unified,
+        )
 
+    def _link_replies(self, pending_replies: list[tuple[int, str]], uuid_to_id: dict[str, int]) -> None:
+        for message_id, reference_uuid in pending_replies:
+            reply_to_id = uuid_to_id.get(reference_uuid)
+            if reply_to_id is None:
+                reply_to_id = self.get_id_from_uuid(reference_uuid)
+            if reply_to_id is not None:
                 self.cursor.execute(
-                    """
-                    INSERT INTO messages (conversation_id, author_id, author, nick, reply_to, content, timestamp, uuid)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        conversation_id,
-                        author_id,
-                        message.author.name,
-                        message.author.nick,
-                        None,
-                        message.content,
-                        int(message.timestamp),
-                        message.uuid,
-                    ),
+                    "UPDATE messages SET reply_to = ? WHERE id = ?",
+                    (reply_to_id, message_id),
                 )
-                message_id = self.cursor.lastrowid
-                uuid_to_id[message.uuid] = message_id
 
+    def _rewrite_conversation(self, conversation_id: int, conversation: Conversation) -> None:
+        """Drop the stored rows for the conversation and insert it again from scratch.
+
+        Messages already folded into the conversation summary aren't part of a loaded conversation,
+        so they're kept as they are.
+        """
+        _, summarized_until = self._get_summary(conversation_id)
+        self.cursor.execute(
+            "SELECT id FROM messages WHERE conversation_id = ? AND timestamp > ?",
+            (conversation_id, summarized_until if summarized_until is not None else -1),
+        )
+        old_message_ids = [message_row[0] for message_row in self.cursor.fetchall()]
+        old_blob_hashes = self._blob_hashes_for_messages(old_message_ids)
+        for old_message_id in old_message_ids:
+            self.cursor.execute("DELETE FROM attachments WHERE message_id = ?", (old_message_id,))
+            self.cursor.execute("DELETE FROM moderations WHERE message_id = ?", (old_message_id,))
+            self.cursor.execute("DELETE FROM messages WHERE id = ?", (old_message_id,))
+
+        uuid_to_id: dict[str, int] = {}
+        pending_replies: list[tuple[int, str]] = []
+        for message in conversation.messages:
+            message_id = self._insert_message(conversation_id, message)
+            uuid_to_id[message.uuid] = message_id
+            if message.reference and message.reference.uuid:
+                pending_replies.append((message_id, message.reference.uuid))
+        self._link_replies(pending_replies, uuid_to_id)
+        self._upsert_authors(conversation.messages)
+        # re-inserted attachments point at the same blobs again, only truly dropped ones go
+        self._collect_orphan_blobs(old_blob_hashes)
+
+    def _append_conversation(self, conversation_id: int, conversation: Conversation) -> tuple[int, int]:
+        """Insert only messages that aren't stored yet and update moderation rows that changed.
+
+        Returns (inserted messages, updated moderations).
+        """
+        self.cursor.execute(
+            "SELECT uuid, id FROM messages WHERE conversation_id = ?", (conversation_id,)
+        )
+        uuid_to_id: dict[str, int] = dict(self.cursor.fetchall())
+        self.cursor.execute(
+            """
+            SELECT md.message_id,
+                   md.flagged,
+                   md.moderated,
+                   md.harassment,
+                   md.harassment_threatening,
+                   md.sexual,
+                   md.hate,
+                   md.hate_threatening,
+                   md.illicit,
+                   md.illicit_violent,
+                   md.self_harm_intent,
+                   md.self_harm_instruction,
+                   md.self_harm,
+                   md.sexual_minors,
+                   md.violence,
+                   md.violence_graphic,
+                   md.banned_word
+            FROM moderations md
+                     INNER JOIN messages m ON m.id = md.message_id
+            WHERE m.conversation_id = ?
+            """,
+            (conversation_id,),
+        )
+        stored_moderations = {row[0]: tuple(row[1:]) for row in self.cursor.fetchall()}
+
+        inserted_messages: list[Message] = []
+        updated = 0
+        pending_replies: list[tuple[int, str]] = []
+        for message in conversation.messages:
+            message_id = uuid_to_id.get(message.uuid)
+            if message_id is None:
+                message_id = self._insert_message(conversation_id, message)
+                uuid_to_id[message.uuid] = message_id
                 if message.reference and message.reference.uuid:
                     pending_replies.append((message_id, message.reference.uuid))
+                inserted_messages.append(message)
+                continue
 
-                for attachment in message.attachments:
-                    self.cursor.execute(
-                        """
-                        INSERT INTO attachments (message_id, type, filename, url, data)
-                        VALUES (?, ?, ?, ?, ?)
-                        """,
-                        (
-                            message_id,
-                            type(attachment).__name__,
-                            attachment.filename,
-                            getattr(attachment, "url", None),
-                            getattr(attachment, "data", None),
-                        ),
-                    )
+            if not message.moderation:
+                continue
+            stored_moderation = stored_moderations.get(message_id)
+            if stored_moderation is None:
+                self._save_message_moderation(message_id, message.moderation)
+                updated += 1
+            elif stored_moderation != self._moderation_values(message.moderation):
+                self._update_message_moderation(message_id, message.moderation)
+                updated += 1
 
-                if message.moderation:
-                    self._save_message_moderation(message_id, message.moderation)
+        self._link_replies(pending_replies, uuid_to_id)
+        self._upsert_authors(inserted_messages)
+        return len(inserted_messages), updated
 
-            for message_id, reference_uuid in pending_replies:
-                reply_to_id = uuid_to_id.get(reference_uuid)
-                if reply_to_id is None:
-                    reply_to_id = self.get_id_from_uuid(reference_uuid)
-                if reply_to_id is not None:
-                    self.cursor.execute(
-                        "UPDATE messages SET reply_to = ? WHERE id = ?",
-                        (reply_to_id, message_id),
-                    )
+    def save_conversation(self, channel_id: int, conversation: Conversation, compact: bool = False) -> None:
+        """Persist a conversation for a channel.
+
+        By default this is append-only: messages whose uuid is already stored are left alone (apart from
+        moderation changes), so a save costs O(new messages). compact=True rewrites the whole conversation,
+        which also drops stored messages that are no longer part of it.
+        """
+        if not self.connected:
+            constants.MAIN_LOG.log(
+                Error("Database not connected. Cannot save conversation.")
+            )
+            return
+        try:
+            conversation_id = self._ensure_conversation(channel_id)
+            if compact:
+                self._rewrite_conversation(conversation_id, conversation)
+                self.connection.commit()
+                constants.MAIN_LOG.log(Info(f"Conversation compacted for channel {channel_id}"))
+                return
 
+            inserted, updated = self._append_conversation(conversation_id, conversation)
             self.connection.commit()
-            constants.MAIN_LOG.log(Info(f"Conversation saved for channel {channel_id}"))
+            constants.MAIN_LOG.log(
+                Info(
+                    f"Conversation saved for channel {channel_id} "
+                    f"({inserted} new messages, {updated} moderation updates)"
+                )
+            )
         except sqlite3.Error as e:
+            self.connection.rollback()
+            if self.unified:
+                # the directory already saw the rolled back users rows
+                self.users_manager.reload_directory()
             constants.MAIN_LOG.log(Error(f"Error saving conversation: {e}"))
             raise e
 
+    def compact_conversation(self, channel_id: int) -> None:
+        """Rewrite a stored conversation from scratch (explicit maintenance path)."""
+        self.save_conversation(channel_id, self.load_conversation(channel_id), compact=True)
+        # sweep blobs orphaned by anything else too (e.g. messages replaced through the uuid conflict clause)
+        removed = self._collect_orphan_blobs()
+        self.connection.commit()
+        if removed:
+            constants.MAIN_LOG.log(Info(f"Removed {removed} unreferenced attachment blobs."))
+
     def load_conversation(self, channel_id: int) -> Conversation:
         if not self.connected:
             constants.MAIN_LOG.log(
@@ -698,21 +1482,9 @@ class ConversationDatabaseManager(DatabaseManager):
                 )
                 return Conversation()
 
-            self.cursor.execute(
-                """
-                SELECT id
-                FROM messages
-                WHERE conversation_id = ?
-                ORDER BY timestamp ASC
-                """,
-                (row[0],),
-            )
-            message_rows = self.cursor.fetchall()
             conversation = Conversation()
-            for (message_id,) in message_rows:
-                message = self.resolve_replies(message_id)
-                if message:
-                    conversation.add_message(message)
+            conversation.summary, summarized_until = self._get_summary(row[0])
+            conversation.extend(self._load_messages_bulk(row[0], after_timestamp=summarized_until))
             constants.MAIN_LOG.log(Info(f"Conversation loaded for channel {channel_id}"))
             return conversation
         except sqlite3.Error as e:
@@ -730,21 +1502,9 @@ class ConversationDatabaseManager(DatabaseManager):
             self.cursor.execute("SELECT id FROM conversations")
             conversation_rows = self.cursor.fetchall()
             for (conversation_id,) in conversation_rows:
-                self.cursor.execute(
-                    """
-                    SELECT id
-                    FROM messages
-                    WHERE conversation_id = ?
-                    ORDER BY timestamp
-                    """,
-                    (conversation_id,),
-                )
-                message_rows = self.cursor.fetchall()
                 conversation = Conversation()
-                for (message_id,) in message_rows:
-                    message = self.resolve_replies(message_id)
-                    if message:
-                        conversation.add_message(message)
+                conversation.summary, summarized_until = self._get_summary(conversation_id)
+                conversation.extend(self._load_messages_bulk(conversation_id, after_timestamp=summarized_until))
                 conversations_dict[conversation_id] = conversation
             constants.MAIN_LOG.log(Info("All messages loaded from database."))
             return conversations_dict
@@ -772,19 +1532,107 @@ class ConversationDatabaseManager(DatabaseManager):
                 "SELECT id FROM messages WHERE conversation_id = ?", (conversation_id,)
             )
             message_ids = [message_row[0] for message_row in self.cursor.fetchall()]
+            blob_hashes = self._blob_hashes_for_messages(message_ids)
             for message_id in message_ids:
                 self.cursor.execute("DELETE FROM attachments WHERE message_id = ?", (message_id,))
                 self.cursor.execute("DELETE FROM moderations WHERE message_id = ?", (message_id,))
             self.cursor.execute(
                 "DELETE FROM messages WHERE conversation_id = ?", (conversation_id,)
             )
+            self._collect_orphan_blobs(blob_hashes)
+            self.cursor.execute(
+                "DELETE FROM conversation_summaries WHERE conversation_id = ?", (conversation_id,)
+            )
             self.cursor.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
             self.connection.commit()
             constants.MAIN_LOG.log(Info(f"Conversation deleted for channel {channel_id}"))
         except sqlite3.Error as e:
+            # this is the long-lived writer connection, the next save's commit must not finish a half delete
+            self.connection.rollback()
+            if self.unified:
+                # same as save_conversation, keep the directory in line with the rolled back users.db
+                self.users_manager.reload_directory()
             constants.MAIN_LOG.log(Error(f"Error deleting conversation: {e}"))
             raise e
 
+    def _get_summary(self, conversation_id: int) -> tuple[str | None, int | None]:
+        self.cursor.execute(
+            "SELECT summary, summarized_until FROM conversation_summaries WHERE conversation_id = ?",
+            (conversation_id,),
+        )
+        row = self.cursor.fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def count_unsummarized_messages(self, channel_id: int) -> int:
+        """Number of stored messages in a channel that haven't been folded into its summary yet."""
+        if not self.connected:
+            constants.MAIN_LOG.log(
+                Error("Database not connected. Cannot count messages.")
+            )
+            return 0
+        try:
+            _, summarized_until = self._get_summary(channel_id)
+            self.cursor.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ? AND timestamp > ?",
+                (channel_id, summarized_until if summarized_until is not None else -1),
+            )
+            return self.cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            constants.MAIN_LOG.log(Error(f"Error counting messages: {e}"))
+            raise e
+
+    def load_oldest_unsummarized_messages(
+            self, channel_id: int, limit: int
+    ) -> tuple[str | None, list[Message]]:
+        """Return the current summary and the oldest `limit` messages that aren't part of it yet."""
+        if not self.connected:
+            constants.MAIN_LOG.log(
+                Error("Database not connected. Cannot load messages.")
+            )
+            return None, []
+        try:
+            summary, summarized_until = self._get_summary(channel_id)
+            messages = self._load_messages_bulk(
+                channel_id, after_timestamp=summarized_until, limit=limit + 1
+            )
+            if len(messages) > limit:
+                # timestamps are stored in whole seconds and the summary cutoff is a timestamp, so don't
+                # split a second between the batch and what comes after it
+                next_timestamp = messages[limit].timestamp
+                messages = [message for message in messages[:limit] if message.timestamp < next_timestamp]
+            return summary, messages
+        except sqlite3.Error as e:
+            constants.MAIN_LOG.log(Error(f"Error loading messages to summarize: {e}"))
+            raise e
+
+    def save_conversation_summary(self, channel_id: int, summary: str, summarized_until: int) -> None:
+        """Store the rolling summary, covering every message up to and including summarized_until."""
+        if not self.connected:
+            constants.MAIN_LOG.log(
+                Error("Database not connected. Cannot save summary.")
+            )
+            return
+        try:
+            self.cursor.execute("SELECT id FROM conversations WHERE id = ?", (channel_id,))
+            if not self.cursor.fetchone():
+                # conversation was deleted while the summary was being generated
+                return
+            self.cursor.execute(
+                """
+                INSERT INTO conversation_summaries (conversation_id, summary, summarized_until, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(conversation_id) DO UPDATE SET summary          = excluded.summary,
+                                                           summarized_until = excluded.summarized_until,
+                                                           updated_at       = excluded.updated_at
+                """,
+                (channel_id, summary, summarized_until, int(time.time())),
+            )
+            self.connection.commit()
+            constants.MAIN_LOG.log(Info(f"Conversation summary updated for channel {channel_id}"))
+        except sqlite3.Error as e:
+            constants.MAIN_LOG.log(Error(f"Error saving conversation summary: {e}"))
+            raise e
+
     def get_all_message_history_for_user(
             self, user_id: int
     ) -> list[UserMessageHistoryEntry]:
@@ -882,12 +1730,314 @@ class ConversationDatabaseManager(DatabaseManager):
 
     def get_user_history(self, user_id: int) -> UserHistoryBundle:
         """Return profile + full message/moderation history for one user ID."""
+        if self.unified:
+            return self._get_user_history_joined(user_id)
         return UserHistoryBundle(
             profile=self.users_manager.get_user_profile(user_id),
             messages=self.get_all_message_history_for_user(user_id),
             moderations=self.get_all_moderation_history_for_user(user_id),
         )
 
+    def get_user_stats(self, user_id: int) -> UserStats:
+        """Return the aggregate counters for one user ID (all zero if they never wrote anything)."""
+        if not self.connected:
+            constants.MAIN_LOG.log(
+                Error("Database not connected. Cannot load user stats.")
+            )
+            return UserStats(user_id=user_id)
+        try:
+            self.cursor.execute(
+                f"""
+                SELECT message_count, flagged_count, {", ".join(MODERATION_CATEGORY_COLUMNS)}
+                FROM user_stats
+                WHERE user_id = ?
+                """,
+                (user_id,),
+            )
+            row = self.cursor.fetchone()
+        except sqlite3.Error as e:
+            constants.MAIN_LOG.log(Error(f"Error loading user stats: {e}"))
+            raise e
+        if row is None:
+            return UserStats(user_id=user_id)
+        return UserStats(
+            user_id=user_id,
+            message_count=row[0],
+            flagged_count=row[1],
+            category_counts={
+                category: count for category, count in zip(MODERATION_CATEGORY_NAMES, row[2:]) if count
+            },
+        )
+
+    def get_recent_message_history_for_user(
+            self, user_id: int, limit: int
+    ) -> list[UserMessageHistoryEntry]:
+        """Return the latest `limit` messages authored by one user ID, oldest first."""
+        if not self.connected:
+            constants.MAIN_LOG.log(
+                Error("Database not connected. Cannot load user message history.")
+            )
+            return []
+        try:
+            self.cursor.execute(
+                """
+                SELECT id, conversation_id, uuid, content, timestamp, author, nick
+                FROM messages
+                WHERE author_id = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+                """,
+                (user_id, limit),
+            )
+            rows = self.cursor.fetchall()
+            return [
+                UserMessageHistoryEntry(
+                    message_id=row[0],
+                    conversation_id=row[1],
+                    uuid=row[2],
+                    content=row[3],
+                    timestamp=row[4],
+                    author_name=row[5],
+                    author_nick=row[6],
+                )
+                for row in reversed(rows)
+            ]
+        except sqlite3.Error as e:
+            constants.MAIN_LOG.log(Error(f"Error loading user message history: {e}"))
+            raise e
+
+    def get_user_summary(self, user_id: int, recent_limit: int = constants.PROFILE_RECENT_MESSAGES) -> UserSummary:
+        """Return profile, stats and latest messages for one user ID, independent of history length."""
+        return UserSummary(
+            profile=self.users_manager.get_user_profile(user_id),
+            stats=self.get_user_stats(user_id),
+            recent_messages=self.get_recent_message_history_for_user(user_id, recent_limit),
+        )
+
+    def _get_user_history_joined(self, user_id: int) -> UserHistoryBundle:
+        """get_user_history as one query, possible when users.db is attached to this connection."""
+        if not self.connected:
+            constants.MAIN_LOG.log(
+                Error("Database not connected. Cannot load user history.")
+            )
+            return UserHistoryBundle(profile=None, messages=[], moderations=[])
+        try:
+            self.cursor.execute(
+                """
+                SELECT u.id,
+                       u.name,
+                       u.nick,
+                       u.notes,
+                       u.last_message_uuid,
+                       u.last_seen_at,
+                       u.notes_message_count,
+                       m.id,
+                       m.conversation_id,
+                       m.uuid,
+                       m.content,
+                       m.timestamp,
+                       m.author,
+                       m.nick,
+                       md.flagged,
+                       md.moderated,
+                       md.harassment,
+                       md.harassment_threatening,
+                       md.sexual,
+                       md.hate,
+                       md.hate_threatening,
+                       md.illicit,
+                       md.illicit_violent,
+                       md.self_harm_intent,
+                       md.self_harm_instruction,
+                       md.self_harm,
+                       md.sexual_minors,
+                       md.violence,
+                       md.violence_graphic,
+                       md.banned_word
+                FROM (SELECT ? AS id) wanted
+                         LEFT JOIN users.users u ON u.id = wanted.id
+                         LEFT JOIN messages m ON m.author_id = wanted.id
+                         LEFT JOIN moderations md ON md.message_id = m.id
+                ORDER BY m.timestamp, m.id, md.id
+                """,
+                (user_id,),
+            )
+            rows = self.cursor.fetchall()
+        except sqlite3.Error as e:
+            constants.MAIN_LOG.log(Error(f"Error loading user history: {e}"))
+            raise e
+
+        profile = None
+        if rows and rows[0][0] is not None:
+            profile = UserProfile(*rows[0][:7])
+        messages: list[UserMessageHistoryEntry] = []
+        moderations: list[UserModerationHistoryEntry] = []
+        for row in rows:
+            message_id = row[7]
+            if message_id is None:
+                continue  # no messages at all, just the profile (or nothing)
+            if not messages or messages[-1].message_id != message_id:
+                messages.append(UserMessageHistoryEntry(message_id, *row[8:14]))
+            if row[14] is not None:
+                moderations.append(
+                    UserModerationHistoryEntry(
+                        message_id=message_id,
+                        conversation_id=row[8],
+                        uuid=row[9],
+                        timestamp=row[11],
+                        moderation=self._moderation_from_row(row[14:]),
+                    )
+                )
+        return UserHistoryBundle(profile=profile, messages=messages, moderations=moderations)
+
+
+class ModerationCacheDatabaseManager(DatabaseManager):
+    """Content-addressed cache of Moderations API results, stored in cache.db.
+
+    Keys come from classes.moderation_cache_key (SHA-256 of the moderated text or attachment bytes). Entries expire after `ttl_seconds`
+    and the least recently used ones are evicted once the cache holds more than `max_entries`.
+    """
+
+    db_path = constants.CACHE_DATABASE_FILE
+
+    def __init__(
+            self,
+            db_path: str | None = None,
+            ttl_seconds: int = constants.MODERATION_CACHE_TTL_SECONDS,
+            max_entries: int = constants.MODERATION_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # moderation runs on several executor threads, they all share this connection
+        self.lock = threading.Lock()
+        super().__init__(db_path)
+
+    def initialize_tables(self) -> None:
+        if not self.connected:
+            constants.MAIN_LOG.log(
+                Error("Database not connected. Cannot initialize cache tables.")
+            )
+            return
+        try:
+            self.cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS moderation_cache
+                (
+                    key          TEXT PRIMARY KEY,
+                    result       TEXT NOT NULL,
+                    created_at   REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+                """
+            )
+            self.cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_moderation_cache_last_used_at
+                    ON moderation_cache (last_used_at)
+                """
+            )
+            self.connection.commit()
+            constants.MAIN_LOG.log(Info("Cache tables initialized successfully."))
+        except sqlite3.Error as e:
+            constants.MAIN_LOG.log(Error(f"Error initializing cache tables: {e}"))
+            raise e
+
+    def get_many(self, keys: list[str]) -> dict[str, dict]:
+        """Return cached moderation results for whichever keys are present and not expired."""
+        if not self.connected or not keys:
+            return {}
+        unique_keys = list(dict.fromkeys(keys))
+        now = time.time()
+        with self.lock:
+            try:
+                found: dict[str, dict] = {}
+                expired: list[str] = []
+                for start in range(0, len(unique_keys), SQL_IN_BATCH_SIZE):
+                    batch = unique_keys[start:start + SQL_IN_BATCH_SIZE]
+                    placeholders = ", ".join("?" for _ in batch)
+                    self.cursor.execute(
+                        f"SELECT key, result, created_at FROM moderation_cache WHERE key IN ({placeholders})",
+                        batch,
+                    )
+                    for key, result, created_at in self.cursor.fetchall():
+                        if now - created_at > self.ttl_seconds:
+                            expired.append(key)
+                        else:
+                            found[key] = json.loads(result)
+                if expired:
+                    self.cursor.executemany(
+                        "DELETE FROM moderation_cache WHERE key = ?", [(key,) for key in expired]
+                    )
+                if found:
+                    self.cursor.executemany(
+                        "UPDATE moderation_cache SET last_used_at = ? WHERE key = ?",
+                        [(now, key) for key in found],
+                    )
+                self.connection.commit()
+                self.hits += sum(1 for key in keys if key in found)
+                self.misses += sum(1 for key in keys if key not in found)
+                return found
+            except sqlite3.Error as e:
+                constants.MAIN_LOG.log(Error(f"Error reading moderation cache: {e}"))
+                raise e
+
+    def put_many(self, results: dict[str, dict]) -> None:
+        """Store moderation results, then evict least recently used entries beyond max_entries."""
+        if not self.connected or not results:
+            return
+        now = time.time()
+        with self.lock:
+            try:
+                self.cursor.executemany(
+                    """
+                    INSERT INTO moderation_cache (key, result, created_at, last_used_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET result       = excluded.result,
+                                                   created_at   = excluded.created_at,
+                                                   last_used_at = excluded.last_used_at
+                    """,
+                    [(key, json.dumps(result), now, now) for key, result in results.items()],
+                )
+                self.cursor.execute(
+                    """
+                    DELETE FROM moderation_cache
+                    WHERE key IN (SELECT key
+                                  FROM moderation_cache
+                                  ORDER BY last_used_at DESC
+                                  LIMIT -1 OFFSET ?)
+                    """,
+                    (self.max_entries,),
+                )
+                self.connection.commit()
+            except sqlite3.Error as e:
+                constants.MAIN_LOG.log(Error(f"Error writing moderation cache: {e}"))
+                raise e
+
+    def purge_expired(self) -> int:
+        """Delete every expired entry, returning how many were removed."""
+        if not self.connected:
+            return 0
+        with self.lock:
+            try:
+                self.cursor.execute(
+                    "DELETE FROM moderation_cache WHERE created_at < ?",
+                    (time.time() - self.ttl_seconds,),
+                )
+                self.connection.commit()
+                return self.cursor.rowcount
+            except sqlite3.Error as e:
+                constants.MAIN_LOG.log(Error(f"Error purging moderation cache: {e}"))
+                raise e
+
+    def stats(self) -> dict[str, int]:
+        """Hit/miss counters for this process plus the current number of entries."""
+        with self.lock:
+            self.cursor.execute("SELECT COUNT(*) FROM moderation_cache")
+            entries = self.cursor.fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
 
 # Backward-compatible aliases while main code migrates to UsersDatabaseManager.
 UserDataManager = UsersDatabaseManager
@@ -0,0 +1,54 @@
+"""shared HTTP client for remote model + moderation calls, keeps keep-alive connections pooled between requests"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import constants
+from objlog.LogMessages import Info
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=constants.REMOTE_HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=constants.REMOTE_HTTP_POOL_SIZE,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+                constants.REMOTE_LOG.log(
+                    Info(f"Created shared HTTP session (pool size {constants.REMOTE_HTTP_POOL_SIZE}).")
+                )
+    return _session
+
+
+def timeout_for(endpoint: str) -> tuple[float, float]:
+    """(connect, read) timeout for one of the endpoints in constants.REMOTE_TIMEOUTS."""
+    return constants.REMOTE_TIMEOUTS.get(
+        endpoint, (constants.REMOTE_CONNECT_TIMEOUT_SECONDS, constants.REMOTE_TIMEOUT_SECONDS)
+    )
+
+
+def post(endpoint: str, url: str, **kwargs) -> requests.Response:
+    """POST through the shared session with the endpoint's configured timeout."""
+    kwargs.setdefault("timeout", timeout_for(endpoint))
+    return get_session().post(url, **kwargs)
+
+
+def close() -> None:
+    """Close pooled connections (on shutdown)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
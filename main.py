@@ -1,4 +1,4 @@
-from objlog.LogMessages import Debug
+from objlog.LogMessages import Debug, Info
 
 import classes
 import ollama_model_interface
@@ -6,87 +6,114 @@ import chatcompletions_interface
 import constants
 import re
 import asyncio
+import itertools
+import threading
+import time
+import uuid
+import async_databases
 import databases
-from collections import Counter
+import http_client
+from contextlib import aclosing
+from typing import AsyncIterator
 
 import discord
 from discord import app_commands
 
+from channel_scheduler import ChannelScheduler
+from conversation_cache import ConversationCache
+from message_cache import DiscordMessageCache
+from summarizer import ConversationSummarizer
+from profile_notes import ProfileNotesWorker, PRIORITY_REQUESTED, format_category_counts
 from classes import Message, AudioAttachment, TextAttachment, VideoAttachment, ImageAttachment, PDFAttachment
 
-users_db_manager = databases.UsersDatabaseManager(constants.USERS_DATABASE_FILE)
-db_manager = databases.ConversationDatabaseManager(
-    constants.DATABASE_FILE, users_manager=users_db_manager
+database_pool = async_databases.DatabaseWorkerPool(
+    constants.DATABASE_FILE, constants.USERS_DATABASE_FILE
 )
+users_db_manager = async_databases.AsyncUsersDatabaseManager(database_pool)
+conversation_cache = ConversationCache()
+db_manager = async_databases.AsyncConversationDatabaseManager(database_pool, cache=conversation_cache)
+moderation_cache = databases.ModerationCacheDatabaseManager(constants.CACHE_DATABASE_FILE)
+discord_message_cache = DiscordMessageCache()
 
 use_remote = constants.use_remote
 
 commands_registered = False
 
 
+MENTION_PATTERN = re.compile(r"<@!?(\d+|[a-zA-Z0-9_]+)>")
+
+
 async def swap_mentions(
         content: str, client: discord.Client, message: discord.Message
 ) -> str:
     # find all mentions of the form <@username> into proper mention format, and proper mention format into <@username>
     # main difference is prop. mentions are only integers, while the other form is username (alphanumeric)
-    # just find all mentions (both forms) and swap them
-    mention_pattern_generic = r"<@!?(\d+|[a-zA-Z0-9_]+)>"
-    mentions = re.findall(mention_pattern_generic, content)
-    if mentions:
-        constants.MAIN_LOG.log(constants.Debug(f"Found mentions to swap: {mentions}"))
-    for mention in mentions:
-
-        # check if it's a DOA mention, if so, replace with <@DOA>
-        if mention == str(client.user.id):
-            content = content.replace(
-                f"<@{client.user.id}>", f"<@{client.user.name}>"
-            ).strip()
-            continue
-
-        if mention.isdigit():
-            # proper mention format, swap to username
-            cache_lookup = users_db_manager.get_user_by_id(int(mention))
-            if cache_lookup:
-                mention_str = f"<@{mention}>"
-                content = content.replace(mention_str, f"<@{cache_lookup}>").strip()
-                continue
-            # not in cache, fetch from discord
-            try:
-                user = await client.fetch_user(int(mention))
-                if user:
-                    # save to cache
-                    users_db_manager.cache_user(int(mention), user.name)
-                    mention_str = f"<@{mention}>"
-                    content = content.replace(mention_str, f"<@{user.name}>").strip()
-            except discord.errors.NotFound:
-                constants.MAIN_LOG.log(
-                    constants.Warn(
-                        f"User with ID {mention} not found for mention swap."
-                    )
-                )
-                continue
-        else:
-            # username format, swap to proper mention
+    # resolve every mention up front in batches, then swap them all in one pass
+    mentions = set(MENTION_PATTERN.findall(content))
+    if not mentions:
+        return content
+    constants.MAIN_LOG.log(constants.Debug(f"Found mentions to swap: {mentions}"))
+
+    # DOA mentions become <@DOA's name>
+    replacements = {str(client.user.id): client.user.name}
+
+    # proper mention format, swap to username
+    user_ids = {int(mention) for mention in mentions if mention.isdigit() and mention != str(client.user.id)}
+    names_by_id = await users_db_manager.resolve_user_names(user_ids)
+
+    async def fetch_user(user_id: int) -> discord.User | None:
+        try:
+            return await client.fetch_user(user_id)
+        except discord.errors.NotFound:
+            constants.MAIN_LOG.log(
+                constants.Warn(f"User with ID {user_id} not found for mention swap.")
+            )
+            return None
+
+    # not in cache, fetch from discord
+    for user in await asyncio.gather(*(fetch_user(user_id) for user_id in user_ids - names_by_id.keys())):
+        if user:
+            await users_db_manager.cache_user(user.id, user.name)
+            names_by_id[user.id] = user.name
+    replacements.update({str(user_id): user_name for user_id, user_name in names_by_id.items()})
+
+    # username format, swap to proper mention
+    user_names = {mention for mention in mentions if not mention.isdigit()}
+    if user_names:
+        # load from cache first, in guilds and DMs alike
+        ids_by_name = await users_db_manager.resolve_user_ids(user_names)
+        missing = user_names - ids_by_name.keys()
+        if missing:
+            # then whoever discord.py knows about, the DM partner being the likely one in DMs
             if isinstance(message.channel, discord.DMChannel):
-                user = None
-                for member in client.users:
-                    if member.name == mention:
-                        user = member
-                        break
+                candidates = itertools.chain((message.channel.recipient, message.author), client.users)
             else:
-                # load from cache first
-                cache_lookup = users_db_manager.get_user_by_name(mention)
-                if cache_lookup:
-                    mention_str = f"<@{mention}>"
-                    content = content.replace(mention_str, f"<@{cache_lookup}>").strip()
+                candidates = message.guild.members
+            for user in candidates:
+                if user is None or user.name not in missing:
                     continue
-                user = discord.utils.get(message.guild.members, name=mention)
-            if user:
                 # save to cache
-                users_db_manager.cache_user(user.id, mention)
-                mention_str = f"<@{mention}>"
-                content = content.replace(mention_str, f"<@{user.id}>").strip()
-    return content
+                await users_db_manager.cache_user(user.id, user.name)
+                ids_by_name[user.name] = user.id
+                missing.discard(user.name)
+                if not missing:
+                    break
+        replacements.update({user_name: str(user_id) for user_name, user_id in ids_by_name.items()})
+
+    swapped = MENTION_PATTERN.sub(
+        lambda match: f"<@{replacements[match.group(1)]}>" if match.group(1) in replacements else match.group(0),
+        content,
+    )
+    return swapped.strip() if swapped != content else content
+
+
+# stable namespace for message uuids derived from discord message ids
+DISCORD_MESSAGE_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://discord.com/channels")
+
+
+def discord_message_uuid(message_id: int) -> str:
+    """uuid of the Message converted from a discord message, the same every time that message is converted"""
+    return str(uuid.uuid5(DISCORD_MESSAGE_NAMESPACE, str(message_id)))
 
 
 async def convert_message(message: discord.Message, client: discord.Client, is_context: bool, enable_attachments: bool = True) -> Message:
@@ -108,6 +135,7 @@ async def convert_message(message: discord.Message, client: discord.Client, is_c
         user_id=str(message.author.id),
     )
     msg = classes.Message()
+    msg.uuid = discord_message_uuid(message.id)
     msg.content = await swap_mentions(message.content, client, message)
     msg.author = person
     msg.timestamp = message.created_at.timestamp()
@@ -170,6 +198,40 @@ async def convert_message(message: discord.Message, client: discord.Client, is_c
     return msg
 
 
+async def convert_message_cached(message: discord.Message, client: discord.Client, is_context: bool) -> Message:
+    """convert_message, reusing an earlier conversion of the same (unedited) message if there is one"""
+    return await discord_message_cache.convert(
+        message, is_context, lambda: convert_message(message, client, is_context)
+    )
+
+
+async def gather_context_messages(message: discord.Message, client: discord.Client) -> list[Message]:
+    """Convert the recent channel messages before `message` that don't involve the bot, a few at a time."""
+    history = [
+        msg
+        async for msg in message.channel.history(limit=constants.CONTEXT_MESSAGE_LIMIT, before=message.created_at)
+        if msg.author != client.user and client.user not in msg.mentions and msg != message
+    ]
+    semaphore = asyncio.Semaphore(constants.CONTEXT_FETCH_CONCURRENCY)
+
+    async def convert_context_message(msg: discord.Message) -> Message:
+        async with semaphore:
+            context_ref_message = None
+            if msg.reference:
+                try:
+                    ref_msg = await discord_message_cache.fetch(message.channel, msg.reference.message_id)
+                    context_ref_message = await convert_message_cached(ref_msg, client, is_context=True)
+                except Exception as e:
+                    constants.MAIN_LOG.log(
+                        constants.Warn(f"Failed to fetch referenced message for context: {e}")
+                    )
+            context_message = await convert_message_cached(msg, client, is_context=True)
+            context_message.reference = context_ref_message
+            return context_message
+
+    return list(await asyncio.gather(*(convert_context_message(msg) for msg in history)))
+
+
 def split_message(content: str, max_length: int = 2000) -> list[str]:
     if len(content) <= max_length:
         return [content]
@@ -199,6 +261,113 @@ def split_message(content: str, max_length: int = 2000) -> list[str]:
     return parts
 
 
+def strip_name_prefix(content: str) -> str:
+    # because the AI model is stupid, sometimes it includes the username in the response, we have to strip it out (strip out all text at beginning that matches "Daughter of Anton: ")
+    # keep in mind, sometimes it puts several (ex: "Daughter of Anton: Daughter of Anton: How can I help you?")
+    while content.startswith("Daughter of Anton: "):
+        content = content[len("Daughter of Anton: "):].strip()
+    return content
+
+
+async def stream_in_thread(stream_factory, *args) -> AsyncIterator[str]:
+    """run a blocking generator in a worker thread and yield its items on the event loop
+
+    if the consumer stops early (error, cancellation), the worker stops at the next item and closes the
+    generator, which closes the underlying HTTP stream. use it with contextlib.aclosing, so that happens
+    right away rather than whenever this async generator gets garbage collected.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = object()
+    stop = threading.Event()
+
+    def produce() -> None:
+        stream = None
+        try:
+            stream = stream_factory(*args)
+            for item in stream:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            if stream is not None:
+                stream.close()
+            loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        await producer
+    finally:
+        stop.set()
+
+
+class ProgressiveReply:
+    """a bot reply that is sent early and edited as more text arrives
+
+    the text is laid out with split_message, so once it passes 2000 characters it rolls over into
+    a new message chained to the previous one, exactly like a normal multi-part reply.
+    """
+
+    def __init__(self, trigger: discord.Message, edit_interval: float = constants.STREAM_EDIT_INTERVAL_SECONDS) -> None:
+        self.trigger = trigger
+        self.edit_interval = edit_interval
+        self.text = ""
+        self.sent: list[discord.Message] = []
+        self.sent_contents: list[str] = []
+        self.last_sync = 0.0
+
+    async def push(self, delta: str) -> None:
+        """add streamed text, flushing to discord at most once per edit_interval"""
+        self.text += delta
+        now = time.monotonic()
+        if now - self.last_sync >= self.edit_interval:
+            self.last_sync = now
+            display = strip_name_prefix(self.text)
+            if display:
+                await self._sync(display)
+
+    async def finish(self, content: str) -> None:
+        """make the discord messages show exactly `content`"""
+        await self._sync(content)
+
+    async def _sync(self, content: str) -> None:
+        is_dm = isinstance(self.trigger.channel, discord.DMChannel)
+        parts = ["." if part == "" else part for part in split_message(content, 2000)]
+        for index, part in enumerate(parts):
+            if index < len(self.sent):
+                if self.sent_contents[index] != part:
+                    await self.sent[index].edit(content=part)
+                    self.sent_contents[index] = part
+                continue
+            previous = self.sent[-1] if self.sent else self.trigger
+            self.sent.append(
+                await self.trigger.channel.send(part, reference=(previous if not is_dm else None))
+            )
+            self.sent_contents.append(part)
+        # the final text can come out shorter than a streamed preview (mention swaps), drop leftovers
+        while len(self.sent) > len(parts):
+            await self.sent.pop().delete()
+            self.sent_contents.pop()
+
+    async def discard(self) -> None:
+        """delete whatever was already sent, e.g. the preview of a reply that failed halfway"""
+        while self.sent:
+            try:
+                await self.sent.pop().delete()
+            except discord.HTTPException as e:
+                constants.MAIN_LOG.log(constants.Warn(f"Couldn't delete a partial reply: {e}"))
+            self.sent_contents.pop()
+
+
 def main() -> None:
     global commands_registered
     # Initialize Discord client
@@ -216,6 +385,8 @@ def main() -> None:
             system_prompt=None, api_key=constants.REMOTE_AUTH_API_KEY
         )
     )
+    summarizer = ConversationSummarizer(model, db_manager)
+    profile_notes = ProfileNotesWorker(model, db_manager, users_db_manager)
 
     @client.event
     async def on_ready():
@@ -224,89 +395,111 @@ def main() -> None:
         constants.MAIN_LOG.log(constants.Info(f"Logged in as {client.user}"))
 
     @client.event
-    async def on_message(message: discord.Message):
-        if message.author == client.user:
-            return  # Ignore messages from the bot itself
-        # Only respond to messages that mention the bot in guild channels, or any message in DMs, or replies to the bot SPECIFICALLY
-        replies_to_bot = False
-        ref_message = None
-        if message.reference:
-            try:
-                ref_message = await message.channel.fetch_message(
-                    message.reference.message_id
-                )
-                if ref_message.author == client.user:
-                    replies_to_bot = True
-            except Exception as e:
-                constants.MAIN_LOG.log(
-                    constants.Warn(f"Failed to fetch referenced message: {e}")
-                )
-        if (
-                not isinstance(message.channel, discord.DMChannel)
-                and client.user not in message.mentions
-                and not replies_to_bot
-        ):
-            return  # Ignore messages that don't mention the bot in guild channels or reply to it
+    async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+        # raw events fire for every message, on_message_edit only for ones in discord.py's own cache
+        discord_message_cache.put(payload.message)
 
-        # swap mentions in message content
-        message.content = await swap_mentions(message.content, client, message)
-
-        if ref_message:
-            ref_message: classes.Message = await convert_message(ref_message, client, is_context=False)
-        # Get or create conversation for the channel
-        conversation = db_manager.load_conversation(message.channel.id)
+    @client.event
+    async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+        discord_message_cache.invalidate(payload.message_id)
 
-        constants.MAIN_LOG.log(
-            constants.Info(f"Received message from {message.author}: {message.content}")
+    @client.event
+    async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+        for message_id in payload.message_ids:
+            discord_message_cache.invalidate(message_id)
+
+    async def resolve_reference(
+            message: discord.Message, conversation: classes.Conversation, batch: list[Message]
+    ) -> Message | None:
+        """the converted message `message` replies to, reusing one from the conversation or batch if possible"""
+        if not message.reference:
+            return None
+        try:
+            ref_message = await discord_message_cache.fetch(message.channel, message.reference.message_id)
+        except Exception as e:
+            constants.MAIN_LOG.log(constants.Warn(f"Failed to fetch referenced message: {e}"))
+            return None
+        # replies usually target something already in the conversation, reuse it instead of converting. a later
+        # part of a multi-part bot reply maps to the first part, which is what the stored response is keyed by
+        ref_uuid = discord_message_uuid(discord_message_cache.reply_head(ref_message.id))
+        for user_message in batch:
+            if user_message.uuid == ref_uuid:
+                return user_message
+        return conversation.find_message(ref_uuid) or (
+            await convert_message_cached(ref_message, client, is_context=False)
         )
 
-        # Add user message to conversation
-        user_message = await convert_message(message, client, is_context=False)
-        user_message.reference = ref_message
+    async def respond(messages: list[discord.Message]):
+        """answer one or more mentions in the same channel with a single reply (to the newest one)"""
+        message = messages[-1]
+        pre_model_start = time.perf_counter()
+        # pull context messages (recent messages in the channel not mentioning or involving the bot) while the
+        # stored conversation loads and gets moderated
+        context_task = None
+        if not isinstance(message.channel, discord.DMChannel):
+            context_task = asyncio.create_task(gather_context_messages(message, client))
+
+        # Get or create conversation for the channel, converting the user messages (mentions swapped, attachments
+        # downloaded) meanwhile. Conversions are memoized per discord message, so nothing is converted twice.
+        try:
+            conversation, *user_messages = await asyncio.gather(
+                db_manager.load_conversation(message.channel.id),
+                *(convert_message_cached(msg, client, is_context=False) for msg in messages),
+            )
+            for msg, user_message in zip(messages, user_messages):
+                user_message.reference = await resolve_reference(msg, conversation, user_messages)
+        except BaseException:
+            if context_task:
+                context_task.cancel()
+            raise
+
+        for msg, user_message in zip(messages, user_messages):
+            constants.MAIN_LOG.log(
+                constants.Info(f"Received message from {msg.author}: {user_message.content}")
+            )
+
+        # Add user messages to conversation
         temp_conv = classes.Conversation()
         temp_conv.messages = conversation.messages.copy()
-        temp_conv.add_message(user_message)
+        temp_conv.summary = conversation.summary
+        temp_conv.extend(user_messages)
+
+        # moderate the temp conversation in the background while we gather context, the messages to moderate
+        # are claimed right away so the context messages added below stay out of it
+        moderation_task = temp_conv.run_moderations_async(
+            api_key=constants.REMOTE_AUTH_API_KEY,
+            moderation_url=constants.REMOTE_SOURCE_URL,
+            cache=moderation_cache,
+        )
 
-        # moderate the temp conversation
-        if constants.ENABLE_MODERATION:
-            temp_conv.run_moderations(api_key=constants.REMOTE_AUTH_API_KEY, moderation_url=constants.REMOTE_SOURCE_URL)
+        if context_task:
+            # messages that already made it into the stored conversation don't need to be there twice
+            known_uuids = {msg.uuid for msg in temp_conv.messages}
+            temp_conv.extend(msg for msg in await context_task if msg.uuid not in known_uuids)
 
-        if not isinstance(message.channel, discord.DMChannel):
-            # pull context messages (past 10 messages in the channel not mentioning or involving the bot)
-            async for msg in message.channel.history(
-                    limit=10, before=message.created_at
-            ):
-                if msg.author == client.user:
-                    continue
-                if client.user in msg.mentions:
-                    continue
-                if msg == message:
-                    continue
-                # add to conversation history
-                context_ref_message = None
-                if msg.reference:
-                    try:
-                        ref_msg = await message.channel.fetch_message(
-                            msg.reference.message_id
-                        )
-                        context_ref_message = await convert_message(ref_msg, client, is_context=True)
-                    except Exception as e:
-                        constants.MAIN_LOG.log(
-                            constants.Warn(
-                                f"Failed to fetch referenced message for context: {e}"
-                            )
-                        )
-                context_message = await convert_message(msg, client, is_context=True)
-                context_message.reference = context_ref_message
-                temp_conv.add_message(context_message)
+        if moderation_task:
+            await moderation_task
+        constants.MAIN_LOG.log(
+            constants.Debug(
+                f"Pre-model phase took {(time.perf_counter() - pre_model_start) * 1000:.0f} ms "
+                f"({len(temp_conv.messages)} messages in context)"
+            )
+        )
 
         # Generate response from model
         # make bot begin typing
+        reply = ProgressiveReply(message)
         async with message.channel.typing():
             try:
-                anton_response = await asyncio.to_thread(
-                    model.generate_response, temp_conv
-                )
+                if constants.STREAM_RESPONSES:
+                    async with aclosing(stream_in_thread(model.stream_response, temp_conv)) as deltas:
+                        async for delta in deltas:
+                            await reply.push(delta)
+                    anton_response = classes.AntonMessage(content=reply.text)
+                else:
+                    anton_response = await asyncio.to_thread(
+                        model.generate_response, temp_conv
+                    )
                 # add both user message and bot response to conversation
                 conversation.messages = temp_conv.messages
                 conversation.add_message(anton_response)
@@ -316,6 +509,8 @@ def main() -> None:
                     constants.Error(f"Error generating response"),
                     e
                 )
+                # don't leave a half streamed answer next to the error message
+                await reply.discard()
                 await message.channel.send(
                     "I unfortunately encountered an error while trying to respond :(",
                     reference=(
@@ -326,37 +521,30 @@ def main() -> None:
                 )
                 return
 
-        # because the AI model is stupid, sometimes it includes the username in the response, we have to strip it out (strip out all text at beginning that matches "Daughter of Anton: ")
-        # keep in mind, sometimes it puts several (ex: "Daughter of Anton: Daughter of Anton: How can I help you?")
-        while anton_response.content.startswith("Daughter of Anton: "):
-            anton_response.content = anton_response.content[
-                len("Daughter of Anton: "):
-            ].strip()
+        anton_response.content = strip_name_prefix(anton_response.content)
 
         anton_response.content = await swap_mentions(
             anton_response.content, client, message
         )
-        # verify anton_response is under 2000 characters, if not, send multiple messages, each chain-responded (also add "..." at the end of each message except the last, as well as "..." at the beginning of each message except the first)
-        # split into chunks of 2000 characters or fewer
-        max_length = 2000
-        messages = split_message(anton_response.content, max_length)
-
-        # Send response(s) back to Discord
-        prev = message
-        for content in messages:
-            content = "." if content == "" else content
-            prev = await message.channel.send(
-                content,
-                reference=(
-                    prev if not isinstance(message.channel, discord.DMChannel) else None
-                ),
-            )
+        # Send (or finish editing) response(s) back to Discord, replies over 2000 characters become several
+        # chain-responded messages with "..." at the end of each one except the last and at the beginning of
+        # each one except the first
+        await reply.finish(anton_response.content)
+        if reply.sent:
+            # lets later replies to this message (to any of its parts) find it in the conversation
+            anton_response.uuid = discord_message_uuid(reply.sent[0].id)
+            discord_message_cache.add_reply_parts(reply.sent)
 
         # clear context messages
         conversation.clear_context()
 
         # Save conversation to database
-        db_manager.save_conversation(message.channel.id, conversation)
+        await db_manager.save_conversation(message.channel.id, conversation)
+        # fold old history into the channel summary if it got long (runs in the background)
+        summarizer.schedule(message.channel.id)
+        # and let existing profile notes of whoever spoke catch up eventually (also in the background)
+        for author in {msg.author.id: msg.author for msg in messages}.values():
+            profile_notes.schedule(author.id, author.display_name)
 
         constants.MAIN_LOG.log(
             constants.Info(f"Sent response: {anton_response.content}")
@@ -367,6 +555,37 @@ def main() -> None:
             )
         )
 
+    # one reply at a time per channel, so every reply sees the conversation the previous one saved
+    scheduler = ChannelScheduler(respond)
+
+    @client.event
+    async def on_message(message: discord.Message):
+        # remember every message we see, our own replies included, they're the usual reply targets
+        discord_message_cache.put(message)
+        if message.author == client.user:
+            return  # Ignore messages from the bot itself
+        # Only respond to messages that mention the bot in guild channels, or any message in DMs, or replies to the bot SPECIFICALLY
+        replies_to_bot = False
+        if message.reference:
+            try:
+                ref_message = await discord_message_cache.fetch(
+                    message.channel, message.reference.message_id
+                )
+                if ref_message.author == client.user:
+                    replies_to_bot = True
+            except Exception as e:
+                constants.MAIN_LOG.log(
+                    constants.Warn(f"Failed to fetch referenced message: {e}")
+                )
+        if (
+                not isinstance(message.channel, discord.DMChannel)
+                and client.user not in message.mentions
+                and not replies_to_bot
+        ):
+            return  # Ignore messages that don't mention the bot in guild channels or reply to it
+
+        scheduler.submit(message)
+
     if not commands_registered:
         commands_registered = True
 
@@ -375,7 +594,7 @@ def main() -> None:
             description="Make DOA forget the conversation history for this channel.",
         )
         async def i_forgot(interaction: discord.Interaction):
-            db_manager.delete_conversation(interaction.channel_id)
+            await db_manager.delete_conversation(interaction.channel_id)
             await interaction.response.send_message(
                 "I've forgotten our conversation history. Let's start fresh!",
                 ephemeral=True,
@@ -400,7 +619,7 @@ def main() -> None:
                     ephemeral=True,
                 )
                 return
-            db_manager.delete_conversation(interaction.channel_id)
+            await db_manager.delete_conversation(interaction.channel_id)
 
             # Delete bot messages in the channel
             def is_bot_message(msg: discord.Message) -> bool:
@@ -425,137 +644,35 @@ def main() -> None:
             if interaction.guild is not None:
                 member = interaction.guild.get_member(target.id)
 
-            history = db_manager.get_user_history(int(target.id))
-            profile = history.profile
-            messages_hist = history.messages
-            moderations_hist = history.moderations
-
-            latest_message_uuid = messages_hist[-1].uuid if messages_hist else None
-            latest_message_timestamp = int(messages_hist[-1].timestamp) if messages_hist else None
-
-            category_display_names = {
-                "harassment": "Harassment",
-                "harassment_threats": "Harassment Threats",
-                "sexual_content": "Sexual Content",
-                "hate": "Hate",
-                "hate_threat": "Hate Threat",
-                "illicit": "Illicit",
-                "illicit_violent": "Illicit Violent",
-                "self_harm_intent": "Self Harm Intent",
-                "self_harm_instruction": "Self Harm Instruction",
-                "self_harm": "Self Harm",
-                "sexual_minors": "Sexual Minors",
-                "violence": "Violence",
-                "violence_graphic": "Violence Graphic",
-            }
-
-            category_counts: Counter[str] = Counter()
-            for moderation_entry in moderations_hist:
-                if not moderation_entry.moderation.flagged:
-                    continue
-                for category in moderation_entry.moderation.categories.get_flagged_categories():
-                    category_counts[category] += 1
-
-            should_refresh_notes = False
-            if profile is None:
-                should_refresh_notes = True
-            elif not profile.notes or not profile.notes.strip():
-                should_refresh_notes = True
-            elif latest_message_uuid and profile.last_message_uuid != latest_message_uuid:
-                should_refresh_notes = True
-
-            if should_refresh_notes:
-                recent_messages = messages_hist[-8:]
-                recent_message_snippets = "\n".join(
-                    [f"- {(msg.content or '').replace(chr(10), ' ')[:180]}" for msg in recent_messages]
-                )
-                if not recent_message_snippets:
-                    recent_message_snippets = "- No message history available."
-
-                category_summary_for_prompt = ", ".join(
-                    [
-                        f"{count}x({category_display_names.get(category, category.replace('_', ' ').title())})"
-                        for category, count in sorted(
-                        category_counts.items(), key=lambda item: (-item[1], item[0])
-                    )
-                    ]
-                ) or "None"
-
-                profile_prompt = (
-                    "Write a concise, friendly profile blurb (2-4 sentences) for a Discord user based on activity stats. "
-                    "Avoid sensitive assumptions and keep tone neutral but personable.\n\n"
-                    f"Username: {target.name}\n"
-                    f"Display name: {target.display_name}\n"
-                    f"Total messages: {len(messages_hist)}\n"
-                    f"Times flagged: {sum(1 for m in moderations_hist if m.moderation.flagged)}\n"
-                    f"Moderation categories: {category_summary_for_prompt}\n"
-                    "Recent messages:\n"
-                    f"{recent_message_snippets}"
-                )
-
-                generated_notes = None
-                try:
-                    generated_notes = await asyncio.to_thread(
-                        model.basic_chat,
-                        profile_prompt,
-                        "You generate short user profile blurbs for a Discord bot command.",
-                    )
-                except Exception:
-                    try:
-                        fallback_conv = classes.Conversation()
-                        fallback_conv.add_message(
-                            classes.Message(
-                                content=profile_prompt,
-                                author=classes.Person(name="Profile Generator"),
-                            )
-                        )
-                        fallback_response = await asyncio.to_thread(
-                            model.generate_response, fallback_conv
-                        )
-                        generated_notes = fallback_response.content
-                    except Exception as e:
-                        constants.MAIN_LOG.log(
-                            constants.Warn(
-                                f"Failed to generate profile notes for user {target.id}: {e}"
-                            )
-                        )
-
-                final_notes = (generated_notes or "").strip()
-                if not final_notes:
-                    final_notes = (
-                        profile.notes
-                        if profile and profile.notes
-                        else "No notes available yet for this user."
-                    )
-
-                users_db_manager.upsert_user(
-                    user_id=int(target.id),
-                    user_name=target.name,
-                    nick=member.nick if member else None,
-                    notes=final_notes,
-                    last_message_uuid=latest_message_uuid,
-                    last_seen_at=latest_message_timestamp,
-                )
-                profile = users_db_manager.get_user_profile(int(target.id))
+            summary = await db_manager.get_user_summary(int(target.id))
+            nick = member.nick if member else None
+            if summary.profile is None or (summary.profile.name, summary.profile.nick) != (target.name, nick):
+                # keep the stored name/nick current, the notes worker reads them from there
+                await users_db_manager.upsert_user(user_id=int(target.id), user_name=target.name, nick=nick)
+                summary.profile = await users_db_manager.get_user_profile(int(target.id))
+            profile = summary.profile
+            stats = summary.stats
+
+            # answer with the notes we have, outdated or missing ones get (re)written in the background
+            notes_stale = profile_notes.is_stale(summary)
+            if notes_stale:
+                profile_notes.schedule(int(target.id), target.display_name, PRIORITY_REQUESTED)
+            if profile is not None and profile.notes and profile.notes.strip():
+                notes = profile.notes
+            elif notes_stale:
+                notes = "No profile notes available yet, check back in a bit."
+            else:
+                notes = "No profile notes available yet."
 
-            total_messages = len(messages_hist)
-            # times_moderated = sum(1 for m in moderations_hist if m.moderation.moderated)
-            times_flagged = sum(1 for m in moderations_hist if m.moderation.flagged)
+            total_messages = stats.message_count
+            times_flagged = stats.flagged_count
 
-            moderation_breakdown = " ".join(
-                [
-                    f"{count}x({category_display_names.get(category, category.replace('_', ' ').title())})"
-                    for category, count in sorted(
-                    category_counts.items(), key=lambda item: (-item[1], item[0])
-                )
-                ]
-            ) or "None"
+            moderation_breakdown = format_category_counts(stats.category_counts, " ")
 
             profile_display_name = member.display_name if member else target.display_name
             embed = discord.Embed(
                 title=f"{profile_display_name}'s Profile",
-                description=("DOA's Notes:\n" + (
-                    profile.notes if profile and profile.notes else "No profile notes available yet.")),
+                description="DOA's Notes:\n" + notes,
                 color=discord.Color.blurple(),
             )
             # embed.add_field(name="User", value=f"{target.mention} (`{target.id}`)", inline=False)
@@ -577,6 +694,11 @@ if __name__ == "__main__":
         main()
     except KeyboardInterrupt:
         print("Cleaning up...")
+    constants.MAIN_LOG.log(Info(f"Conversation cache stats: {conversation_cache.stats()}"))
+    constants.MAIN_LOG.log(Info(f"Discord message cache stats: {discord_message_cache.stats()}"))
+    database_pool.close()
+    moderation_cache.close()
+    http_client.close()
     # close logs with grace
     constants.MAIN_LOG.await_finish()
     constants.REMOTE_LOG.await_finish()
@@ -0,0 +1,133 @@
+"""short-lived cache of Discord messages (and their converted classes.Message) keyed by Discord message id"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import discord
+
+import constants
+from classes import Message
+
+
+def _same_version(a: discord.Message, b: discord.Message) -> bool:
+    # history() and fetch_message() hand out new objects for the same message, so compare edits instead
+    return a is b or a.edited_at == b.edited_at
+
+
+class _CachedMessage:
+    __slots__ = ("raw", "converted", "stored_at")
+
+    def __init__(self, raw: discord.Message) -> None:
+        self.raw = raw
+        self.converted: dict[bool, Message] = {}  # keyed by is_context
+        self.stored_at = time.monotonic()
+
+
+class DiscordMessageCache:
+    """Bounded TTL + LRU cache in front of channel.fetch_message and convert_message.
+
+    Fed by every message the bot sees through the gateway and every message it fetches, and kept honest by the
+    edit/delete events, so reply targets and context windows usually resolve without a REST call.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = constants.DISCORD_MESSAGE_CACHE_MAX_ENTRIES,
+            ttl_seconds: float = constants.DISCORD_MESSAGE_CACHE_TTL_SECONDS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[int, _CachedMessage] = OrderedDict()
+        self._pending: dict[int, asyncio.Future[discord.Message]] = {}
+        # later parts of multi-part bot replies -> first part, the one the stored response's uuid comes from
+        self._reply_heads: OrderedDict[int, int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, message_id: int) -> _CachedMessage | None:
+        entry = self._entries.get(message_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.stored_at > self.ttl_seconds:
+            del self._entries[message_id]
+            return None
+        self._entries.move_to_end(message_id)
+        return entry
+
+    def put(self, message: discord.Message) -> None:
+        """Remember a message as it currently is, dropping any conversions of an older version."""
+        self._entries[message.id] = _CachedMessage(message)
+        self._entries.move_to_end(message.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, message_id: int) -> None:
+        self._entries.pop(message_id, None)
+
+    def add_reply_parts(self, parts: list[discord.Message]) -> None:
+        """Remember that these messages (in order) are one bot reply, see reply_head."""
+        for part in parts[1:]:
+            self._reply_heads[part.id] = parts[0].id
+            self._reply_heads.move_to_end(part.id)
+        while len(self._reply_heads) > self.max_entries:
+            self._reply_heads.popitem(last=False)
+
+    def reply_head(self, message_id: int) -> int:
+        """id of the first part of the bot reply message_id belongs to, message_id itself if unknown.
+
+        only known for replies sent since the last restart (and not yet pushed out by newer ones).
+        """
+        return self._reply_heads.get(message_id, message_id)
+
+    async def fetch(self, channel: discord.abc.Messageable, message_id: int) -> discord.Message:
+        """channel.fetch_message, unless the message is cached."""
+        entry = self._entry(message_id)
+        if entry is not None:
+            self.hits += 1
+            return entry.raw
+        self.misses += 1
+        pending = self._pending.get(message_id)
+        if pending is None:
+            # several context messages often reply to the same message, fetch it only once
+            pending = asyncio.ensure_future(channel.fetch_message(message_id))
+            self._pending[message_id] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(message_id, None))
+        message = await asyncio.shield(pending)
+        self.put(message)
+        return message
+
+    async def convert(
+            self,
+            message: discord.Message,
+            is_context: bool,
+            converter: Callable[[], Awaitable[Message]],
+    ) -> Message:
+        """Converted version of `message`, running `converter` only if it hasn't been converted yet.
+
+        Every call gets its own copy (see Message.copy), callers set the reply link and claim moderation on
+        it, and that mustn't leak into the next event or a conversation that already holds an earlier copy.
+        """
+        entry = self._entry(message.id)
+        if entry is not None and _same_version(entry.raw, message) and is_context in entry.converted:
+            self.hits += 1
+            return entry.converted[is_context].copy()
+        self.misses += 1
+        converted = await converter()
+        entry = self._entry(message.id)
+        if entry is None:
+            self.put(message)
+            entry = self._entries[message.id]
+        if _same_version(entry.raw, message):  # not edited while we were converting
+            entry.converted[is_context] = converted
+        return converted.copy()
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
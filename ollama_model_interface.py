@@ -1,8 +1,11 @@
 """ollama interface module, talks to ollama so the rest of the code doesn't have to"""
 
+from typing import Iterator
+
 import ollama
 import classes
 import constants
+import context_window
 
 from objlog.LogMessages import Info, Debug
 
@@ -14,23 +17,57 @@ class OllamaModel(classes.Model):
 
     name: str = "dolphin3"
 
-    def generate_response(
-        self, conversation: classes.Conversation
-    ) -> classes.AntonMessage:
-        """Generate a response using the Ollama model based on the conversation history."""
-        constants.OLLAMA_LOG.log(Info("Generating response using Ollama model."))
+    def _build_messages(self, conversation: classes.Conversation) -> list[dict]:
+        conversation = context_window.fit_to_model(conversation, self.name)
         message_history = []
         for message in conversation.messages:
             role = "assistant" if isinstance(message, classes.AntonMessage) else "user"
             message_history.append(
                 {"role": role, "content": str(message)}
             )
+        system_messages = [{"role": "system", "content": constants.system_prompt()}]
+        summary = context_window.summary_prompt(conversation)
+        if summary:
+            system_messages.append({"role": "system", "content": summary})
+        return system_messages + message_history
 
+    def generate_response(
+        self, conversation: classes.Conversation
+    ) -> classes.AntonMessage:
+        """Generate a response using the Ollama model based on the conversation history."""
+        constants.OLLAMA_LOG.log(Info("Generating response using Ollama model."))
         response = client.chat(
             model=self.name,
-            messages=[{"role": "system", "content": constants.system_prompt()}]
-            + message_history,
+            messages=self._build_messages(conversation),
         )
         constants.OLLAMA_LOG.log(Info("Received response from Ollama model."))
         constants.OLLAMA_LOG.log(Debug(f"Ollama response content: {response}"))
         return classes.AntonMessage(content=response["message"]["content"])
+
+    def stream_response(self, conversation: classes.Conversation) -> Iterator[str]:
+        """Stream the response from the Ollama model chunk by chunk."""
+        constants.OLLAMA_LOG.log(Info("Streaming response using Ollama model."))
+        stream = client.chat(
+            model=self.name,
+            messages=self._build_messages(conversation),
+            stream=True,
+        )
+        try:
+            for chunk in stream:
+                content = chunk["message"]["content"]
+                if content:
+                    yield content
+        finally:
+            # also when the caller stops early, so the HTTP stream doesn't linger until garbage collection
+            stream.close()
+        constants.OLLAMA_LOG.log(Info("Finished streaming response from Ollama model."))
+
+    def basic_chat(self, message: str, appended_system_prompt: str | None = None) -> str:
+        """A basic chat method that sends a single message and gets a response."""
+        messages = [{"role": "system", "content": constants.system_prompt()}]
+        if appended_system_prompt is not None:
+            messages.append({"role": "system", "content": appended_system_prompt})
+        messages.append({"role": "user", "content": message})
+        response = client.chat(model=self.name, messages=messages)
+        constants.OLLAMA_LOG.log(Debug(f"Ollama response content: {response}"))
+        return response["message"]["content"]
@@ -0,0 +1,171 @@
+"""profile notes for /get_profile, (re)written by the model in the background instead of while the command waits"""
+
+import asyncio
+import itertools
+import time
+
+import classes
+import constants
+from async_databases import AsyncConversationDatabaseManager, AsyncUsersDatabaseManager
+from objlog.LogMessages import Info, Warn, Debug
+
+PROFILE_NOTES_SYSTEM_PROMPT = "You generate short user profile blurbs for a Discord bot command."
+
+CATEGORY_DISPLAY_NAMES = {
+    "harassment": "Harassment",
+    "harassment_threats": "Harassment Threats",
+    "sexual_content": "Sexual Content",
+    "hate": "Hate",
+    "hate_threat": "Hate Threat",
+    "illicit": "Illicit",
+    "illicit_violent": "Illicit Violent",
+    "self_harm_intent": "Self Harm Intent",
+    "self_harm_instruction": "Self Harm Instruction",
+    "self_harm": "Self Harm",
+    "sexual_minors": "Sexual Minors",
+    "violence": "Violence",
+    "violence_graphic": "Violence Graphic",
+}
+
+# lower runs first
+PRIORITY_REQUESTED = 0  # someone ran /get_profile and got outdated (or no) notes
+PRIORITY_ACTIVITY = 1  # the user kept chatting, refresh notes that already exist
+
+
+def format_category_counts(category_counts: dict[str, int], separator: str) -> str:
+    """e.g. "3x(Hate) 1x(Violence)", most frequent first, "None" if there aren't any"""
+    return separator.join(
+        [
+            f"{count}x({CATEGORY_DISPLAY_NAMES.get(category, category.replace('_', ' ').title())})"
+            for category, count in sorted(category_counts.items(), key=lambda item: (-item[1], item[0]))
+        ]
+    ) or "None"
+
+
+def build_profile_prompt(summary: classes.UserSummary, display_name: str) -> str:
+    recent_message_snippets = "\n".join(
+        [f"- {(msg.content or '').replace(chr(10), ' ')[:180]}" for msg in summary.recent_messages]
+    )
+    if not recent_message_snippets:
+        recent_message_snippets = "- No message history available."
+
+    return (
+        "Write a concise, friendly profile blurb (2-4 sentences) for a Discord user based on activity stats. "
+        "Avoid sensitive assumptions and keep tone neutral but personable.\n\n"
+        f"Username: {summary.profile.name}\n"
+        f"Display name: {display_name}\n"
+        f"Total messages: {summary.stats.message_count}\n"
+        f"Times flagged: {summary.stats.flagged_count}\n"
+        f"Moderation categories: {format_category_counts(summary.stats.category_counts, ', ')}\n"
+        "Recent messages:\n"
+        f"{recent_message_snippets}"
+    )
+
+
+class ProfileNotesWorker:
+    """Keeps users.notes fresh in the background, one model call at a time and at most one per min_interval.
+
+    Notes count as stale once the user wrote refresh_messages more messages than when they were generated,
+    so a chatty user doesn't trigger a model call per message. /get_profile shows whatever is stored and
+    only queues a refresh.
+    """
+
+    def __init__(
+            self,
+            model: classes.Model,
+            db_manager: AsyncConversationDatabaseManager,
+            users_db_manager: AsyncUsersDatabaseManager,
+            refresh_messages: int = constants.PROFILE_NOTES_REFRESH_MESSAGES,
+            min_interval: float = constants.PROFILE_NOTES_MIN_INTERVAL_SECONDS,
+    ) -> None:
+        self.model = model
+        self.db_manager = db_manager
+        self.users_db_manager = users_db_manager
+        self.refresh_messages = refresh_messages
+        self.min_interval = min_interval
+        self._queue: asyncio.PriorityQueue[tuple[int, int, int]] = asyncio.PriorityQueue()
+        # best priority each user is queued with, older (worse) queue entries for them are skipped
+        self._queued: dict[int, int] = {}
+        self._order = itertools.count()
+        # discord display names as last seen by whoever queued the user, users.db only has the guild nick
+        self._display_names: dict[int, str] = {}
+        self._worker: asyncio.Task | None = None
+        self._last_run = 0.0
+
+    def is_stale(self, summary: classes.UserSummary) -> bool:
+        """whether the stored notes should be regenerated, given the user's current stats"""
+        profile = summary.profile
+        if profile is None or summary.stats.message_count == 0:
+            return False  # nothing to write about
+        if not profile.notes or not profile.notes.strip():
+            return True
+        return summary.stats.message_count - (profile.notes_message_count or 0) >= self.refresh_messages
+
+    def schedule(self, user_id: int, display_name: str, priority: int = PRIORITY_ACTIVITY) -> None:
+        """Queue a staleness check (and regeneration if needed) for the user, once per user."""
+        self._display_names[user_id] = display_name
+        queued = self._queued.get(user_id)
+        if queued is not None and queued <= priority:
+            return
+        self._queued[user_id] = priority
+        self._queue.put_nowait((priority, next(self._order), user_id))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            priority, _, user_id = await self._queue.get()
+            if self._queued.get(user_id) != priority:
+                continue  # re-queued with a better priority, that entry handles it
+            del self._queued[user_id]
+            display_name = self._display_names.pop(user_id, None)
+            try:
+                await self._refresh(user_id, priority, display_name)
+            except Exception as e:
+                constants.MAIN_LOG.log(Warn(f"Failed to refresh profile notes for user {user_id}: {e}"))
+
+    async def _refresh(self, user_id: int, priority: int, display_name: str | None) -> None:
+        summary = await self.db_manager.get_user_summary(user_id)
+        if not self.is_stale(summary):
+            return
+        if priority == PRIORITY_ACTIVITY and not summary.profile.notes:
+            return  # nobody has looked at this user yet, don't spend a model call on them
+
+        # rate limit the model calls, other work queued meanwhile just waits its turn
+        wait = self._last_run + self.min_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+            # the wait may have been long, take the latest stats
+            summary = await self.db_manager.get_user_summary(user_id)
+        self._last_run = time.monotonic()
+
+        prompt = build_profile_prompt(summary, display_name or summary.profile.nick or summary.profile.name)
+        notes = (await self._generate(prompt)).strip()
+        if not notes:
+            constants.MAIN_LOG.log(Warn(f"Model returned empty profile notes for user {user_id}, keeping the old ones."))
+            return
+        await self.users_db_manager.set_user_profile_notes(
+            user_id,
+            notes,
+            notes_message_count=summary.stats.message_count,
+            last_message_uuid=summary.recent_messages[-1].uuid if summary.recent_messages else None,
+        )
+        constants.MAIN_LOG.log(
+            Info(f"Refreshed profile notes for user {user_id} ({summary.stats.message_count} messages).")
+        )
+        constants.MAIN_LOG.log(Debug(f"{self._queue.qsize()} profile notes refreshes still queued."))
+
+    async def _generate(self, prompt: str) -> str:
+        try:
+            return await asyncio.to_thread(self.model.basic_chat, prompt, PROFILE_NOTES_SYSTEM_PROMPT)
+        except Exception:
+            # not every backend has basic_chat, fall back to a one-message conversation
+            fallback_conv = classes.Conversation()
+            fallback_conv.add_message(
+                classes.Message(
+                    content=prompt,
+                    author=classes.Person(name="Profile Generator"),
+                )
+            )
+            fallback_response = await asyncio.to_thread(self.model.generate_response, fallback_conv)
+            return fallback_response.content or ""
@@ -6,7 +6,7 @@ import base64
 
 import classes
 import constants
-import requests
+import http_client
 
 from objlog.LogMessages import Info, Debug, Error, Warn
 
@@ -148,8 +148,8 @@ class Responses(classes.Model):
         constants.REMOTE_LOG.log(
             Info(f"Sending request to Responses API at {self.source_url}")
         )
-        response = requests.post(
-            self.source_url + "/v1/responses", headers=headers, json=payload, timeout=constants.REMOTE_TIMEOUT_SECONDS
+        response = http_client.post(
+            "responses", self.source_url + "/v1/responses", headers=headers, json=payload
         )
         if response.status_code != 200:
             constants.REMOTE_LOG.log(
@@ -0,0 +1,76 @@
+"""rolling conversation summaries, folds old channel history into one summary row off the request path"""
+
+import asyncio
+
+import classes
+import constants
+from async_databases import AsyncConversationDatabaseManager
+from objlog.LogMessages import Info, Warn
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a Discord channel's chat history for a chat bot's long-term memory. "
+    "Merge the previous summary (if any) with the new messages into one updated summary. Keep who said what, "
+    "ongoing topics, facts people shared about themselves, running jokes and anything the bot promised. "
+    "Drop small talk. Write plain prose or short bullet points, at most about 300 words. "
+    "Return only the summary."
+)
+
+
+class ConversationSummarizer:
+    """Folds the oldest messages of long channels into a persisted summary in the background."""
+
+    def __init__(
+            self,
+            model: classes.Model,
+            db_manager: AsyncConversationDatabaseManager,
+            trigger_messages: int = constants.SUMMARY_TRIGGER_MESSAGES,
+            fold_messages: int = constants.SUMMARY_FOLD_MESSAGES,
+    ) -> None:
+        self.model = model
+        self.db_manager = db_manager
+        self.trigger_messages = trigger_messages
+        self.fold_messages = fold_messages
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def schedule(self, channel_id: int) -> None:
+        """Check the channel (and summarize it if needed) in the background, at most one run per channel."""
+        running = self._tasks.get(channel_id)
+        if running and not running.done():
+            return
+        self._tasks[channel_id] = asyncio.create_task(self._run(channel_id))
+
+    async def _run(self, channel_id: int) -> None:
+        try:
+            # keep folding until the channel is back under the threshold
+            while await self.db_manager.count_unsummarized_messages(channel_id) > self.trigger_messages:
+                if not await self._fold(channel_id):
+                    break
+        except Exception as e:
+            constants.MAIN_LOG.log(Warn(f"Failed to summarize conversation for channel {channel_id}: {e}"))
+        finally:
+            self._tasks.pop(channel_id, None)
+
+    async def _fold(self, channel_id: int) -> bool:
+        previous_summary, messages = await self.db_manager.load_oldest_unsummarized_messages(
+            channel_id, self.fold_messages
+        )
+        if not messages:
+            return False
+
+        transcript = "\n".join(str(message) for message in messages)
+        prompt = (
+            f"Previous summary:\n{previous_summary or '(none yet)'}\n\n"
+            f"New messages, oldest first:\n{transcript}"
+        )
+        summary = (await asyncio.to_thread(self.model.basic_chat, prompt, SUMMARY_SYSTEM_PROMPT)).strip()
+        if not summary:
+            constants.MAIN_LOG.log(Warn(f"Model returned an empty summary for channel {channel_id}, skipping."))
+            return False
+
+        await self.db_manager.save_conversation_summary(
+            channel_id, summary, int(messages[-1].timestamp)
+        )
+        constants.MAIN_LOG.log(
+            Info(f"Folded {len(messages)} messages into the summary for channel {channel_id}.")
+        )
+        return True
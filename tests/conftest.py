@@ -0,0 +1,10 @@
+"""puts the project root on sys.path and gives constants.py what it needs to import, like benchmarks/_setup.py"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DOA_DISCORD_BOT_TOKEN", "test")
+os.environ["DOA_LOG_FILE"] = os.path.join(tempfile.gettempdir(), "doa-tests.log")
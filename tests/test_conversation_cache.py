@@ -0,0 +1,89 @@
+"""the conversation cache must never keep a copy that was read before an invalidation landed"""
+
+import asyncio
+
+from async_databases import AsyncConversationDatabaseManager
+from classes import Conversation, Message, Person
+from conversation_cache import ConversationCache
+
+CHANNEL_ID = 1
+
+
+def build_conversation(summary: str | None, contents: list[str]) -> Conversation:
+    conversation = Conversation()
+    conversation.summary = summary
+    for content in contents:
+        conversation.add_message(Message(content=content, author=Person(name="user")))
+    return conversation
+
+
+class SlowReadPool:
+    """stands in for DatabaseWorkerPool, loads return `stored` as it was when the read started and only
+    finish once `release` is set, writes run straight away"""
+
+    def __init__(self, stored: Conversation) -> None:
+        self.stored = stored
+        self.read_started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def read(self, operation):
+        snapshot = self.stored
+        self.read_started.set()
+        await self.release.wait()
+        return snapshot
+
+    async def write(self, operation):
+        return operation(self)
+
+    # the manager calls the pool's writer with these
+    def save_conversation_summary(self, channel_id: int, summary: str, summarized_until: int) -> None:
+        self.stored = build_conversation(summary, ["after the summary"])
+
+    def delete_conversation(self, channel_id: int) -> None:
+        self.stored = Conversation()
+
+
+async def load_racing(write) -> tuple[Conversation, Conversation]:
+    """start a load, run `write` while its read is in flight, then return (what the load got, next load)"""
+    pool = SlowReadPool(build_conversation("old summary", ["folded", "also folded", "after the summary"]))
+    manager = AsyncConversationDatabaseManager(pool, ConversationCache())
+    load = asyncio.create_task(manager.load_conversation(CHANNEL_ID))
+    await pool.read_started.wait()
+    await write(manager)
+    pool.release.set()
+    raced = await load
+    return raced, await manager.load_conversation(CHANNEL_ID)
+
+
+def test_summary_save_during_load_is_not_cached_over():
+    async def run():
+        raced, after = await load_racing(
+            lambda manager: manager.save_conversation_summary(CHANNEL_ID, "new summary", 0)
+        )
+        assert raced.summary == "old summary"  # that load legitimately read the old state
+        assert after.summary == "new summary"
+        assert [message.content for message in after.messages] == ["after the summary"]
+
+    asyncio.run(run())
+
+
+def test_delete_during_load_is_not_cached_over():
+    async def run():
+        _, after = await load_racing(lambda manager: manager.delete_conversation(CHANNEL_ID))
+        assert after.messages == []
+        assert after.summary is None
+
+    asyncio.run(run())
+
+
+def test_load_without_invalidation_is_cached():
+    async def run():
+        pool = SlowReadPool(build_conversation(None, ["hello"]))
+        pool.release.set()
+        cache = ConversationCache()
+        manager = AsyncConversationDatabaseManager(pool, cache)
+        await manager.load_conversation(CHANNEL_ID)
+        await manager.load_conversation(CHANNEL_ID)
+        assert cache.hits == 1 and cache.misses == 1
+
+    asyncio.run(run())
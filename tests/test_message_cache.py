@@ -0,0 +1,33 @@
+"""memoized conversions are handed out as copies, per-event changes to one must not show up in the next"""
+
+import asyncio
+import types
+
+from classes import Message, Person
+from message_cache import DiscordMessageCache
+
+
+def test_convert_hit_is_a_fresh_copy():
+    async def run():
+        cache = DiscordMessageCache()
+        raw = types.SimpleNamespace(id=1, edited_at=None)
+        conversions = []
+
+        async def converter() -> Message:
+            conversions.append(raw.id)
+            return Message(content="hello", author=Person(name="user"))
+
+        first = await cache.convert(raw, False, converter)
+        first.reference = Message(content="replied to")
+        first.moderation.moderated = True  # what Conversation._claim_unmoderated does
+        first.moderation.categories.hate = True
+
+        second = await cache.convert(raw, False, converter)
+        assert conversions == [raw.id]
+        assert second is not first
+        assert second.reference is None
+        assert not second.moderation.moderated
+        assert not second.moderation.categories.hate
+        assert second.uuid == first.uuid  # still the same message as far as the database is concerned
+
+    asyncio.run(run())
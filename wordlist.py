@@ -0,0 +1,132 @@
+"""banned-word matching for moderation: long wordlists compiled into one regex, reloadable at runtime"""
+
+import os
+import re
+import threading
+import time
+from typing import Iterable
+
+import constants
+from objlog.LogMessages import Info, Error
+
+_END = ""  # trie key marking the end of a word (never a real character key)
+# below this many terms, one `in` check per term (C substring search) beats a regex scan, see bench_wordlist.py
+REGEX_MIN_TERMS = 150
+
+
+def _trie_pattern(node: dict) -> str:
+    """regex source matching exactly the words in a trie node, sharing prefixes instead of repeating them"""
+    ends_here = _END in node
+    branches = []
+    single_chars = []
+    for char in sorted(key for key in node if key != _END):
+        child = node[char]
+        if list(child) == [_END]:
+            single_chars.append(char)
+        else:
+            branches.append(re.escape(char) + _trie_pattern(child))
+    if single_chars:
+        if len(single_chars) == 1:
+            branches.append(re.escape(single_chars[0]))
+        else:
+            branches.append("[" + "".join(re.escape(char) for char in single_chars) + "]")
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 and not ends_here else "(?:" + "|".join(branches) + ")"
+    # the optional part is greedy, so the longest word sharing this prefix wins ("gooning" over "goon")
+    return pattern + "?" if ends_here else pattern
+
+
+def compile_wordlist(words: Iterable[str]) -> re.Pattern | None:
+    """one pattern matching any of the (lowercased) words anywhere in a lowercased text, None if there are none"""
+    trie: dict = {}
+    for word in words:
+        word = word.strip().lower()
+        if not word:
+            continue
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[_END] = {}
+    if not trie:
+        return None
+    return re.compile(_trie_pattern(trie))
+
+
+def read_wordlist_file(path: str) -> list[str]:
+    """one term per line, blank lines and lines starting with # are ignored"""
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip() and not line.lstrip().startswith("#")]
+
+
+class WordlistMatcher:
+    """Finds banned words in text, lowercasing it only once however long the wordlist is.
+
+    Short lists are checked term by term (`in` is fast C code), lists of REGEX_MIN_TERMS or more go through
+    one trie shaped regex whose cost barely grows with the number of terms. Matching is substring based and
+    case insensitive, like `word in text.lower()` was. With a wordlist file configured, its terms are added
+    to the built-in ones and the file is re-read when it changes, so the list can be edited without
+    restarting the bot.
+    """
+
+    def __init__(
+            self,
+            words: Iterable[str] = constants.MODERATION_WORDLIST,
+            path: str | None = constants.MODERATION_WORDLIST_FILE,
+            check_interval: float = constants.MODERATION_WORDLIST_CHECK_SECONDS,
+    ) -> None:
+        self.base_words = list(words)
+        self.path = path
+        self.check_interval = check_interval
+        self.words: list[str] = []
+        # (lowercased terms, None) for short lists, (None, compiled pattern) for long ones
+        self._matcher: tuple[tuple[str, ...] | None, re.Pattern | None] = ((), None)
+        self._mtime: float | None = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()  # moderation runs on several threads, only one of them reloads
+        self.reload()
+
+    def reload(self, words: Iterable[str] | None = None) -> None:
+        """Rebuild the matcher from `words` (if given, they replace the built-in list) plus the wordlist file."""
+        with self._lock:
+            if words is not None:
+                self.base_words = list(words)
+            all_words = list(self.base_words)
+            if self.path:
+                try:
+                    self._mtime = os.stat(self.path).st_mtime
+                    all_words.extend(read_wordlist_file(self.path))
+                except OSError as e:
+                    # keep going with what we have, a broken file shouldn't switch moderation off
+                    self._mtime = None
+                    constants.REMOTE_LOG.log(Error(f"Couldn't read wordlist file {self.path}: {e}"))
+            terms = tuple(dict.fromkeys(word.strip().lower() for word in all_words if word.strip()))
+            if len(terms) < REGEX_MIN_TERMS:
+                # longest first, so "gooning" is reported rather than the "goon" inside it, like the regex does
+                matcher = (tuple(sorted(terms, key=len, reverse=True)), None)
+            else:
+                matcher = (None, compile_wordlist(terms))
+            # a single assignment, scans running on other threads keep using the matcher they started with
+            self.words, self._matcher = all_words, matcher
+        constants.REMOTE_LOG.log(Info(f"Wordlist loaded ({len(all_words)} terms)."))
+
+    def reload_if_changed(self) -> None:
+        """Re-read the wordlist file if it was modified, checked at most once per check_interval."""
+        if not self.path or time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.check_interval
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def find(self, text: str) -> str | None:
+        """the first banned word in text, or None"""
+        terms, pattern = self._matcher
+        lowered = text.lower()
+        if pattern is None:
+            return next((term for term in terms if term in lowered), None)
+        match = pattern.search(lowered)
+        return match.group() if match else None